@@ -1,103 +1,74 @@
-import numpy as np
 import pandas as pd
-from typing import Union
-from sklearn.impute import SimpleImputer
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.pipeline import Pipeline
-from sklearn.model_selection import GridSearchCV
-from sklearn.metrics import mean_squared_error
-from feature_selection import get_rf_feature_selection_pipeline, get_rf_feature_selection_grid # type: ignore
-
-def train_rf_model(X_train: Union[np.ndarray, pd.DataFrame], y_train, 
-                   externally_selected_features: Union[None, list] = None, 
-                   time_based_weights: Union[None, bool] = None) -> GridSearchCV:
-    """
-    Trains a random forest model using the given training data and hyperparameters.
-
-    Args:
-        X_train (numpy.ndarray): The training data features.
-        y_train (numpy.ndarray): The training data labels.
-        externally_selected_features (list, optional): A list of feature names to use for training. Defaults to None.
-        time_based_weights (numpy.ndarray, optional): A 1D array of weights to apply to each sample in X_train. Defaults to None.
-
-    Returns:
-        sklearn.model_selection.GridSearchCV: A trained random forest model.
-    """
-    pipeline = get_rf_pipeline()
-    grid = get_rf_grid()
-
-    grid = GridSearchCV(pipeline, n_jobs=-1, param_grid=grid, 
-                        scoring='neg_mean_squared_error', cv=5, verbose=1, 
-                        refit=True)
-    if time_based_weights is not False:
-        grid.fit(X_train, y_train, estimator__sample_weight=time_based_weights)
-    else:
-        grid.fit(X_train, y_train)
-
-    return grid
-
-def get_rf_pipeline() -> Pipeline:
-    """
-    Returns a pipeline for training a random forest model.
-
-    Returns:
-        sklearn.pipeline.Pipeline: A pipeline for training a random forest model.
-    """
-    pipeline_steps = [('imputer', SimpleImputer())]
-    pipeline_steps.extend(get_rf_feature_selection_pipeline())
-    pipeline_steps.append(
-        ('estimator', RandomForestRegressor())
-    )
-
-    return Pipeline(pipeline_steps)
-
-def get_rf_grid() -> dict:
-    """
-    Returns a dictionary of hyperparameters to use for training a random forest model that
-    is used in a grid search.
-
-    Returns:
-        dict: A dictionary of hyperparameters to use for training a random forest model.
-    """
-    rf_grid = {}
-    rf_grid.update(get_rf_feature_selection_grid())
-    rf_grid.update(get_rf_model_grid())
-
-    return rf_grid
-
-def get_rf_model_grid() -> dict:
-    """
-    Returns a dictionary of hyperparameters to use for training a random forest model that
-    is used in a grid search.
-
-    Returns:
-        dict: A dictionary of hyperparameters to use for training a random forest model.
-    """
-    return {
-        'estimator__n_estimators': [200],
-        'estimator__max_depth': [None, 10, 20],
-        'estimator__max_features': [None, 'sqrt', 'log2'],
-        'estimator__min_samples_split': [5, 10],
-        'estimator__min_samples_leaf': [1, 2, 4],
-    }
-
-# Load the dataset
-file_path = 'TUR_combined_with_discharge_SAMPLE_DATA.csv'
-data = pd.read_csv(file_path)
-
-# Identify target variables
-y_columns = [col for col in data.columns if 'turbidity' in col and 'load' in col]
-
-# Identify feature variables
-x_columns = [col for col in data.columns if 'pwna' in col or 'wmth' in col or 'discharge' in col]
-
-# Split data into X and y
-X = data[x_columns]
-y = data[y_columns[0]]
-
-# Train the model
-rf_model = train_rf_model(X, y)
-
-# Return the best parameters and score
-print("Best parameters found: ", rf_model.best_params_)
-print("Best score: ", -rf_model.best_score_)
+from random_forest import train_rf_model
+from inference import export_rf_artifact, benchmark_inference
+from stations import STATIONS, get_station_columns
+from feature_selection import prune_correlated_features, save_feature_pruning, apply_feature_pruning
+
+def train_turbidity_model(file_path='TUR_combined_with_discharge_SAMPLE_DATA.csv',
+                          correlation_file='TUR_correlation_matrix.csv',
+                          missing_values_file='TUR_missing_values.csv',
+                          pruning_file='tur_feature_pruning.json',
+                          artifact_prefix='tur_rf_model'):
+    # Load the dataset
+    data = pd.read_csv(file_path)
+
+    # Identify target variables (upstream lag features of lag_discovery.py are inputs, not targets)
+    y_columns = [col for col in data.columns
+                 if 'turbidity' in col and 'load' in col and not col.endswith('_lag')]
+
+    # Identify feature variables of the registered stations (targets are never used as their own features)
+    x_columns = [col for col in get_station_columns(data.columns) if col not in y_columns]
+
+    # Keep one feature per cluster of highly correlated features, using the correlation matrix and
+    # missing value counts of perform_eda (combined_data_eda.py), and record the kept-to-dropped mapping
+    correlation_matrix = pd.read_csv(correlation_file, index_col=0)
+    missing_values = pd.read_csv(missing_values_file, index_col=0)['missing_values']
+    feature_pruning = prune_correlated_features(correlation_matrix.loc[x_columns, x_columns],
+                                                threshold=0.95, missing_values=missing_values)
+    save_feature_pruning(feature_pruning, pruning_file)
+    print(f"Kept {len(feature_pruning)} of {len(x_columns)} features after correlation pruning")
+
+    # Train one multi-output model per station: the stations are sampled at different timestamps and
+    # outer-merged, so requiring every target of both stations on the same row would drop most rows
+    rf_models = {}
+    for site in STATIONS:
+        site_y_columns = [col for col in y_columns if site in col]
+        if not site_y_columns:
+            continue
+
+        # Keep rows where every target of the station is known and split data into X and y
+        site_data = data.dropna(subset=site_y_columns)
+        X = site_data[x_columns]
+        y = site_data[site_y_columns]
+        print(f"Training the {site} model on {len(site_data)} of {len(data)} rows")
+
+        # Train one multi-output model for the station's targets on time-ordered folds, growing the forest
+        # until its out-of-bag error plateaus
+        rf_model = train_rf_model(X, y, externally_selected_features=feature_pruning, grow_trees=True,
+                                  evaluation='time',
+                                  timestamps=site_data['timestamp_ccentral'], shared_memory=True)
+
+        # Return the best parameters and score
+        # The search scores forests of the search size, the grown forest is scored by its out-of-bag error
+        print("Best parameters found: ", rf_model.best_params_)
+        print("Best score (search forest): ", -rf_model.best_score_)
+        print("Best score per target (search forest): ")
+        print(-rf_model.target_scores_)
+        print("Out-of-bag error by forest size: ")
+        print(rf_model.n_estimators_history_)
+        print("Out-of-bag error of the grown forest: ", rf_model.oob_mse_)
+
+        # Export the best model for batch inference and compare it with sklearn's predict on the same
+        # pruned features (CompiledForest also selects them by name when given a DataFrame)
+        artifact_file = artifact_prefix + '_' + site + '.npz'
+        export_rf_artifact(rf_model.best_estimator_, artifact_file, feature_names=rf_model.feature_names_)
+        print("Inference benchmark: ")
+        print(benchmark_inference(rf_model.best_estimator_, artifact_file,
+                                  apply_feature_pruning(X, feature_pruning).to_numpy()).to_string())
+
+        rf_models[site] = rf_model
+
+    return rf_models
+
+if __name__ == '__main__':
+    train_turbidity_model()
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from typing import Union
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error, mean_squared_error
+from random_forest import train_rf_model
+from time_series_validation import FEATURE_LOOKBACK_HOURS, to_utc_timestamps
+
+def rolling_origin_backtest(X: Union[np.ndarray, pd.DataFrame], y, timestamps,
+                            initial_train_days: float = 30, step_days: float = 7,
+                            horizon_days: float = 7, retune_every: Union[None, int] = None,
+                            embargo_hours: float = FEATURE_LOOKBACK_HOURS, n_jobs: int = -1,
+                            **train_kwargs) -> pd.DataFrame:
+    """
+    Walks forward over the data and reports the test error of a model retrained at each origin.
+
+    Origins start initial_train_days after the first timestamp and advance by step_days. At each
+    origin the model is trained on every row more than embargo_hours before the origin and tested on
+    the following horizon_days. The grid search of train_rf_model only runs when the hyperparameters
+    are (re)tuned; every other origin refits the last tuned pipeline once with the same
+    hyperparameters. Forests cannot be updated with new rows in place, so a fixed-hyperparameter
+    refit is the incremental step. The refits between two tunings are independent and run in parallel.
+
+    Args:
+        X (numpy.ndarray): The features.
+        y (numpy.ndarray): The labels, one column per target for multi-output models.
+        timestamps (array-like): The timestamp of each row.
+        initial_train_days (float, optional): The length of the first training window. Defaults to 30.
+        step_days (float, optional): The time between origins. Defaults to 7.
+        horizon_days (float, optional): The length of each test window. Defaults to 7.
+        retune_every (int, optional): Rerun the grid search every retune_every origins. If None,
+            hyperparameters are only tuned at the first origin. Defaults to None.
+        embargo_hours (float, optional): The gap between the training rows and the origin. Defaults to
+            FEATURE_LOOKBACK_HOURS.
+        n_jobs (int, optional): The number of origins refitted in parallel. Defaults to -1.
+        **train_kwargs: Passed to train_rf_model when tuning, e.g. evaluation or engine. The columns in
+            externally_selected_features and the rows of time_based_weights are also used by every refit.
+
+    Returns:
+        pandas.DataFrame: One row per origin (in UTC) with the training and test sizes, the test mean squared
+            and absolute errors (averaged over targets) and whether the hyperparameters were retuned there.
+    """
+    timestamps = to_utc_timestamps(timestamps)
+
+    # Refits must train on the same columns and weights as the tuned model
+    if train_kwargs.get('externally_selected_features') is not None:
+        X = X[list(train_kwargs['externally_selected_features'])]
+    sample_weight = train_kwargs.pop('time_based_weights', None)
+    if sample_weight is False:
+        sample_weight = None
+    embargo = np.timedelta64(int(embargo_hours * 3600), 's')
+    horizon = pd.Timedelta(days=horizon_days)
+
+    origins = pd.date_range(timestamps.min() + pd.Timedelta(days=initial_train_days),
+                            timestamps.max(), freq=pd.Timedelta(days=step_days))
+    windows = [(origin,
+                np.flatnonzero(timestamps < origin.to_datetime64() - embargo),
+                np.flatnonzero((timestamps >= origin.to_datetime64()) &
+                               (timestamps < (origin + horizon).to_datetime64())))
+               for origin in origins]
+    windows = [window for window in windows if len(window[1]) and len(window[2])]
+
+    block_size = retune_every if retune_every is not None else len(windows)
+    results = []
+    for block_start in range(0, len(windows), max(block_size, 1)):
+        block = windows[block_start:block_start + block_size]
+
+        # Tune on the training window of the first origin of the block. The search already refits the
+        # best pipeline on that window, so it is evaluated as is
+        origin, train_rows, test_rows = block[0]
+        search = train_rf_model(_take_rows(X, train_rows), _take_rows(y, train_rows),
+                                time_based_weights=_take_weights(sample_weight, train_rows),
+                                timestamps=timestamps[train_rows], **train_kwargs)
+        results.append(_evaluate_origin(search.best_estimator_, X, y, origin, train_rows, test_rows,
+                                        sample_weight, refit=False))
+        results[-1]['retuned'] = True
+
+        template = clone(search.best_estimator_)
+        results.extend(Parallel(n_jobs=n_jobs)(
+            delayed(_evaluate_origin)(template, X, y, origin, train_rows, test_rows, sample_weight)
+            for origin, train_rows, test_rows in block[1:]
+        ))
+
+    return pd.DataFrame(results)
+
+
+def _evaluate_origin(model, X, y, origin, train_rows: np.ndarray, test_rows: np.ndarray,
+                     sample_weight=None, refit: bool = True) -> dict:
+    if refit:
+        fit_params = {}
+        if sample_weight is not None:
+            fit_params['estimator__sample_weight'] = _take_weights(sample_weight, train_rows)
+        model = clone(model).fit(_take_rows(X, train_rows), _take_rows(y, train_rows), **fit_params)
+    prediction = model.predict(_take_rows(X, test_rows))
+    y_test = _take_rows(y, test_rows)
+
+    return {
+        'origin': origin,
+        'n_train': len(train_rows),
+        'n_test': len(test_rows),
+        'mse': mean_squared_error(y_test, prediction),
+        'mae': mean_absolute_error(y_test, prediction),
+        'retuned': False,
+    }
+
+
+def _take_rows(data, rows: np.ndarray):
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return data.iloc[rows]
+
+    return np.asarray(data)[rows]
+
+
+def _take_weights(sample_weight, rows: np.ndarray):
+    if sample_weight is None:
+        return None
+
+    return np.asarray(sample_weight)[rows]
@@ -0,0 +1,381 @@
+"""
+CODE PURPOSE: Command line interface for the feature creation, lag discovery,
+              merging, EDA and training stages. Heavy modules (pandas, sklearn)
+              are only imported by the stage that needs them, and independent
+              stages and station jobs run concurrently in dependency order
+
+Examples (from the repository root):
+    python feature_creation/cli.py features --export aquahives_export.csv
+    python feature_creation/cli.py lags --export aquahives_export.csv
+    python feature_creation/cli.py merge --lags
+    python feature_creation/cli.py eda --params turbidity
+    python feature_creation/cli.py train --data TUR_combined_with_discharge_SAMPLE_DATA.csv
+    python feature_creation/cli.py all --export aquahives_export.csv --output-dir output
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+#==================================Stage jobs==================================
+
+def create_features(export: str, sites=None, output_dir: str = '.',
+                    regular_grid: bool = False, partitioned: bool = False,
+                    max_workers=None):
+    '''
+    Create and export the feature tables of the stations sites, reading the
+    export once and computing the stations (or, if partitioned, their time
+    partitions) in parallel
+
+    Parameters
+    ----------
+    export : str
+        Path of the AquaHive export csv
+    sites : list, optional
+        The stations to process. Default all registered stations
+    output_dir : str
+        Directory to write the csv files to. Default current directory
+    regular_grid : bool
+        Passed to the feature functions (see resample_hourly). Default False
+    partitioned : bool
+        If True, process the export in monthly partitions (see
+        partitioned_features.py). Default False
+    max_workers : int, optional
+        Maximum number of worker processes. Default one per CPU
+
+    Returns
+    -------
+    files : list
+        Paths of the exported csv files
+    '''
+    if partitioned:
+        from partitioned_features import create_all_station_features_partitioned
+        return create_all_station_features_partitioned(export, sites=sites,
+                                                       output_dir=output_dir,
+                                                       regular_grid=regular_grid,
+                                                       max_workers=max_workers)
+
+
+    from stations import create_all_station_features
+    return create_all_station_features(read_station_records(export, sites), sites,
+                                       output_dir, regular_grid, max_workers)
+
+
+def create_lag_features(export: str, sites=None, output_dir: str = '.',
+                        partitioned: bool = False, max_workers=None):
+    '''
+    Estimate the travel times between the stations sites and export their
+    upstream lag features (see lag_discovery.py). If partitioned, the export
+    is reduced to hourly records partition by partition instead of being
+    loaded (see create_upstream_lag_features_partitioned)
+
+    Returns
+    -------
+    files : list
+        Paths of the exported lag feature csv files
+    '''
+    if partitioned:
+        from partitioned_features import create_upstream_lag_features_partitioned
+        lags = create_upstream_lag_features_partitioned(export, sites=sites,
+                                                        output_dir=output_dir,
+                                                        max_workers=max_workers)
+    else:
+        from lag_discovery import create_upstream_lag_features
+        lags = create_upstream_lag_features(read_station_records(export, sites),
+                                            output_dir, sites=sites)
+
+
+    return [file for files in lags.get('files', []) for file in files.split(';')]
+
+
+def merge_param(param: str, input_dir: str = '.', output_dir: str = '.',
+                sites=None, lags: bool = False):
+    '''
+    Combine the feature files of parameter param with the discharge files
+    of the stations sites, default all registered stations, and with their
+    upstream lag files if lags (see toc_tur_combined_data.py)
+
+    Returns
+    -------
+    output_file : str
+        Path of the combined csv (e.g., tur_combined_with_discharge.csv)
+    '''
+    from toc_tur_combined_data import combine_param_with_discharge
+
+
+    return combine_param_with_discharge(param, get_combined_file(param, output_dir),
+                                        input_dir=input_dir, sites=sites, lags=lags)
+
+
+def run_param_eda(param: str, input_dir: str = '.', output_dir: str = '.'):
+    '''
+    Run the EDA of combined_data_eda.py on the combined file of parameter param
+
+    Returns
+    -------
+    output_prefix : str
+        Prefix of the EDA csv files (e.g., TUR for TUR_correlation_matrix.csv)
+    '''
+    from combined_data_eda import run_eda
+    output_prefix = get_eda_prefix(param, output_dir)
+    run_eda(get_combined_file(param, input_dir), output_prefix)
+
+
+    return output_prefix
+
+
+def train_model(data: str, eda_prefix: str = 'TUR', output_dir: str = '.'):
+    '''
+    Train the turbidity model of Rand_Fore_Adapt.py on the combined file data,
+    pruning features with the EDA files starting with eda_prefix
+
+    Returns
+    -------
+    artifact_prefix : str
+        Prefix of the exported model artifacts, one per station (e.g.,
+        tur_rf_model_pnwa.npz)
+    '''
+    from Rand_Fore_Adapt import train_turbidity_model
+    artifact_prefix = os.path.join(output_dir, 'tur_rf_model')
+    train_turbidity_model(file_path=data,
+                          correlation_file=eda_prefix+'_correlation_matrix.csv',
+                          missing_values_file=eda_prefix+'_missing_values.csv',
+                          pruning_file=os.path.join(output_dir, 'tur_feature_pruning.json'),
+                          artifact_prefix=artifact_prefix)
+
+
+    return artifact_prefix
+
+
+def read_station_records(export: str, sites=None):
+    '''
+    Return the records of the stations sites (default all registered
+    stations), reading the export in chunks so other stations' records are
+    never held in memory
+    '''
+    import pandas as pd
+    from stations import STATIONS
+    sites = list(sites or STATIONS)
+
+
+    return pd.concat([chunk[chunk['site'].isin(sites)]
+                      for chunk in pd.read_csv(export, chunksize=500000)])
+
+
+def get_combined_file(param: str, directory: str = '.'):
+    '''
+    Return the path of the combined file of parameter param
+    '''
+    from stations import PARAMETERS
+    return os.path.join(directory, PARAMETERS[param]['file_prefix']+'_combined_with_discharge.csv')
+
+
+def get_eda_prefix(param: str, directory: str = '.'):
+    '''
+    Return the prefix of the EDA files of parameter param
+    '''
+    from stations import PARAMETERS
+    return os.path.join(directory, PARAMETERS[param]['file_prefix'].upper())
+
+
+def get_station_params():
+    '''
+    Return the parameters measured at any registered station, in order
+    '''
+    from stations import STATIONS
+    return list(dict.fromkeys(param for station in STATIONS.values()
+                              for param in station['parameters']))
+
+
+#==================================Scheduler===================================
+
+def run_stages(stages: dict, max_workers=None):
+    '''
+    Run stages in worker processes, each as soon as all its dependencies are
+    done, so independent stages (e.g., one per parameter) overlap
+
+    Parameters
+    ----------
+    stages : dict
+        (function, kwargs, dependencies) keyed by stage name, where
+        dependencies is a list of stage names
+    max_workers : int, optional
+        Maximum number of worker processes. Default one per CPU
+
+    Returns
+    -------
+    results : dict
+        The return value of each stage, keyed by stage name
+    '''
+    for name, (_, _, dependencies) in stages.items():
+        unknown = set(dependencies) - set(stages)
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on unknown stages {sorted(unknown)}")
+
+
+    results, running = {}, {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while len(results) < len(stages):
+            for name, (function, kwargs, dependencies) in stages.items():
+                if (name not in results and name not in running.values() and
+                        all(dependency in results for dependency in dependencies)):
+                    running[executor.submit(function, **kwargs)] = name
+
+
+            if not running:
+                raise ValueError('Stage dependencies are circular: '
+                                 + ', '.join(sorted(set(stages) - set(results))))
+
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    for pending in running:
+                        pending.cancel()
+                    print(f'[failed] {name}', file=sys.stderr)
+                    raise
+                print(f'[done] {name}')
+
+
+    return results
+
+
+def get_feature_stages(args):
+    # One stage that fans out over stations (or partitions) itself, so the
+        # export is read or partitioned only once
+    return {'features': (create_features,
+                         {'export': args.export, 'sites': args.sites,
+                          'output_dir': args.output_dir,
+                          'regular_grid': args.regular_grid,
+                          'partitioned': args.partitioned,
+                          'max_workers': args.max_workers},
+                         [])}
+
+
+def get_lag_stages(args):
+    return {'lags': (create_lag_features,
+                     {'export': args.export, 'sites': args.sites,
+                      'output_dir': args.output_dir,
+                      'partitioned': args.partitioned,
+                      'max_workers': args.max_workers},
+                     [])}
+
+
+def get_merge_stages(args, dependencies=()):
+    return {'merge:'+param: (merge_param,
+                             {'param': param, 'input_dir': args.input_dir,
+                              'output_dir': args.output_dir,
+                              'sites': args.sites, 'lags': args.lags},
+                             list(dependencies))
+            for param in args.params or get_station_params()}
+
+
+def get_eda_stages(args, merge_stages=None):
+    return {'eda:'+param: (run_param_eda,
+                           {'param': param, 'input_dir': args.input_dir,
+                            'output_dir': args.output_dir},
+                           ['merge:'+param] if merge_stages else [])
+            for param in args.params or get_station_params()}
+
+
+#==================================Commands====================================
+
+def run_all(args):
+    # Every stage reads from and writes to output_dir
+    args.input_dir = args.output_dir
+    args.params = None
+    args.lags = not args.skip_lags
+
+
+    stages = get_feature_stages(args)
+    if args.lags:
+        stages.update(get_lag_stages(args))
+    stages.update(get_merge_stages(args, dependencies=list(stages)))
+    stages.update(get_eda_stages(args, merge_stages=True))
+    if not args.skip_train:
+        stages['train'] = (train_model,
+                           {'data': get_combined_file('turbidity', args.output_dir),
+                            'eda_prefix': get_eda_prefix('turbidity', args.output_dir),
+                            'output_dir': args.output_dir},
+                           ['eda:turbidity'])
+
+
+    return run_stages(stages, args.max_workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip(),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help='maximum number of concurrent stage processes (default one per CPU)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+
+    features = commands.add_parser('features', help='create the station feature tables')
+    features.add_argument('--export', default='aquahives_export.csv', help='AquaHive export csv')
+    features.add_argument('--output-dir', default='.')
+    features.add_argument('--sites', nargs='+', default=None)
+    features.add_argument('--regular-grid', action='store_true',
+                          help='compute features on a regular hourly grid')
+    features.add_argument('--partitioned', action='store_true',
+                          help='process the export in monthly partitions (out of core)')
+    features.set_defaults(function=lambda args: run_stages(get_feature_stages(args), args.max_workers))
+
+
+    lags = commands.add_parser('lags', help='estimate travel times and create the upstream lag features')
+    lags.add_argument('--export', default='aquahives_export.csv', help='AquaHive export csv')
+    lags.add_argument('--output-dir', default='.')
+    lags.add_argument('--sites', nargs='+', default=None)
+    lags.add_argument('--partitioned', action='store_true',
+                      help='reduce the export to hourly records in monthly partitions (out of core)')
+    lags.set_defaults(function=lambda args: run_stages(get_lag_stages(args), args.max_workers))
+
+
+    merge = commands.add_parser('merge', help='combine feature tables with discharge per parameter')
+    merge.add_argument('--input-dir', default='.')
+    merge.add_argument('--output-dir', default='.')
+    merge.add_argument('--params', nargs='+', default=None)
+    merge.add_argument('--sites', nargs='+', default=None)
+    merge.add_argument('--lags', action='store_true',
+                       help='include the upstream lag features of the lags command')
+    merge.set_defaults(function=lambda args: run_stages(get_merge_stages(args), args.max_workers))
+
+
+    eda = commands.add_parser('eda', help='summary statistics, missing values and correlations')
+    eda.add_argument('--input-dir', default='.')
+    eda.add_argument('--output-dir', default='.')
+    eda.add_argument('--params', nargs='+', default=None)
+    eda.set_defaults(function=lambda args: run_stages(get_eda_stages(args), args.max_workers))
+
+
+    train = commands.add_parser('train', help='train and export the turbidity model')
+    train.add_argument('--data', default='TUR_combined_with_discharge_SAMPLE_DATA.csv')
+    train.add_argument('--eda-prefix', default='TUR',
+                       help='prefix of the EDA csv files used for feature pruning')
+    train.add_argument('--output-dir', default='.')
+    train.set_defaults(function=lambda args: train_model(args.data, args.eda_prefix, args.output_dir))
+
+
+    run = commands.add_parser('all', help='run every stage in dependency order')
+    run.add_argument('--export', default='aquahives_export.csv', help='AquaHive export csv')
+    run.add_argument('--output-dir', default='.')
+    run.add_argument('--sites', nargs='+', default=None)
+    run.add_argument('--regular-grid', action='store_true')
+    run.add_argument('--partitioned', action='store_true')
+    run.add_argument('--skip-lags', action='store_true',
+                     help='leave out the upstream lag features')
+    run.add_argument('--skip-train', action='store_true')
+    run.set_defaults(function=run_all)
+
+
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,5 @@
 import pandas as pd
 
-toc_file = "TOC_combined_with_discharge.csv"
-tur_file = "TUR_combined_with_discharge.csv"
-
-#Reading data
-toc_df = pd.read_csv(toc_file)
-tur_df = pd.read_csv(tur_file)
-
 #EDA function
 def perform_eda(df):
     eda_results = {}
@@ -27,21 +20,6 @@ def perform_eda(df):
     
     return eda_results
 
-#EDA on TOC
-toc_eda = perform_eda(toc_df)
-
-#EDA on TUR
-tur_eda = perform_eda(tur_df)
-
-#EDA results saved separately
-toc_eda['summary_statistics'].to_csv('TOC_summary_statistics.csv')
-toc_eda['missing_values'].to_csv('TOC_missing_values.csv')
-toc_eda['correlation_matrix'].to_csv('TOC_correlation_matrix.csv')
-
-tur_eda['summary_statistics'].to_csv('TUR_summary_statistics.csv')
-tur_eda['missing_values'].to_csv('TUR_missing_values.csv')
-tur_eda['correlation_matrix'].to_csv('TUR_correlation_matrix.csv')
-
 #To separate sum stats, missing values and correlation matrix for better data visualization, blank columns are used
 def create_blank_df(rows):
     return pd.DataFrame({'': [''] * rows})
@@ -60,10 +38,23 @@ def combine_eda_results(eda_results):
     correlation_matrix], axis=1)
     return combined_df
 
-toc_eda_combined = combine_eda_results(toc_eda)
-toc_eda_combined.to_csv('TOC_eda.csv', index=False)
+#Run the EDA on one combined file and save the results separately (e.g. TOC_correlation_matrix.csv) and together (e.g. TOC_eda.csv)
+def run_eda(input_file, output_prefix):
+    eda_results = perform_eda(pd.read_csv(input_file))
+
+    eda_results['summary_statistics'].to_csv(output_prefix + '_summary_statistics.csv')
+    eda_results['missing_values'].to_csv(output_prefix + '_missing_values.csv')
+    eda_results['correlation_matrix'].to_csv(output_prefix + '_correlation_matrix.csv')
+
+    combine_eda_results(eda_results).to_csv(output_prefix + '_eda.csv', index=False)
+    return eda_results
 
-tur_eda_combined = combine_eda_results(tur_eda)
-tur_eda_combined.to_csv('TUR_eda.csv', index=False)
+if __name__ == '__main__':
+    toc_file = "TOC_combined_with_discharge.csv"
+    tur_file = "TUR_combined_with_discharge.csv"
 
+    #EDA on TOC
+    run_eda(toc_file, 'TOC')
 
+    #EDA on TUR
+    run_eda(tur_file, 'TUR')
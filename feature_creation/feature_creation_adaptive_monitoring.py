@@ -5,8 +5,19 @@ Author: Idil Yaktubay (iyaktubay@iisd-ela.org)
 CODE PURPOSE: Define necessary functions for feature creation
 """
 
+import warnings
+import numpy as np
 import pandas as pd
 
+# Conversion of each parameter's values to mg/L for load calculations, as a 
+    # factor or a function of the values. Parameters not listed here are 
+    # assumed to be in mg/L already
+LOAD_CONVERSIONS = {
+    'turbidity': lambda value: value/3.,    # NTU to mg/L
+    'total_dissolved_solids': 1000.,        # ppt to mg/L
+}
+
+
 #=============================Formatting functions=============================
 
 def filter_for_param_site(df, param: str, site: str):
@@ -57,15 +68,142 @@ def convert_timestamps(df):
     
     
     df_out['timestamp_ccentral'] = \
-        pd.to_datetime(df_out['timestamp']).dt.tz_convert('Canada/Central')
+        pd.to_datetime(df_out['timestamp'], utc=True).dt.tz_convert('Canada/Central')
     
     
     return df_out
+
+
+def resample_hourly(df, value_cols: list):
+    '''
+    Return the value_cols of df averaged onto a regular hourly grid, with an
+    explicit gap marker for hours without any records
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive Dataset for a single parameter and site with a 
+        timestamp_ccentral column (see convert_timestamps)
+    value_cols: list
+        The columns to average (e.g., ['value', 'load'])
+
+    Returns
+    -------
+    df_out: DataFrame
+        Hourly averages of value_cols indexed by the start of each hour 
+        (Canada/Central), and a boolean 'gap' column that is True for hours 
+        without records
+    '''
+    # Resample in UTC so DST changes neither merge nor skip hours
+    df_utc = df.set_index(df['timestamp_ccentral'].dt.tz_convert('UTC'))
+    resampled = df_utc[value_cols].resample('h')
+    
+    
+    df_out = resampled.mean()
+    df_out['gap'] = resampled.size() == 0
+    df_out.index = df_out.index.tz_convert('Canada/Central')
+    df_out.index.name = 'timestamp_ccentral'
+    
+    
+    return df_out
+
+
+def calc_hourly_bucket_stats(values, hours_ago_start: int, hours_ago_end: int):
+    '''
+    Return mean, min, max and max-min range of hourly values for the 
+    hours_ago_start-hours_ago_end hours ago bucket of every hour
+
+    Parameters
+    ----------
+    values : Series
+        Values on a regular hourly grid (see resample_hourly), NaN at gaps
+    hours_ago_start : int
+        The start of time bucket (e.g., 4 for 4-6h ago time bucket)
+    hours_ago_end : int
+        The end of time bucket (e.g., 6 for 4-6h ago time bucket)
+
+    Returns
+    -------
+    mean, min_, max_, max_min: Tuple of four Series
+        Bucket statistics aligned with values, NaN where the whole bucket
+        falls in gaps or before the first record
+    '''
+    hours_offset = (hours_ago_end - hours_ago_start) + 1
+    
     
+    # Pad the start so that window i covers the hours i-hours_ago_end to 
+        # i-hours_ago_start, then reduce all windows at once over a strided view
+    padded = np.concatenate([np.full(hours_ago_end, np.nan), 
+                             values.to_numpy(dtype=float)])
+    windows = np.lib.stride_tricks.sliding_window_view(
+                padded, hours_offset)[:len(values)]
+    
+    
+    # All-NaN windows (gaps) are expected and give NaN without a warning
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean = pd.Series(np.nanmean(windows, axis=1), index=values.index)
+        min_ = pd.Series(np.nanmin(windows, axis=1), index=values.index)
+        max_ = pd.Series(np.nanmax(windows, axis=1), index=values.index)
+    max_min = abs(max_ - min_)
+    
+    
+    return mean, min_, max_, max_min
+    
+
+def get_gap_table(hourly, column: str):
+    '''
+    Return the gap marker of hourly as a table in the format of the feature 
+    tables
+
+    Parameters
+    ----------
+    hourly : DataFrame
+        Output of resample_hourly
+    column : str
+        Name of the gap column (e.g., 'turbidity_pnwa_gap')
+
+    Returns
+    -------
+    gaps: DataFrame
+        timestamp_ccentral and a boolean column, True for hours without 
+        records
+    '''
+    gaps = hourly[['gap']].rename(columns={'gap': column})
+    gaps.loc[:, 'timestamp_ccentral'] = gaps.index
+    
+    
+    return gaps.reset_index(drop=True)
+
+
+def convert_to_mg_per_l(values, param: str):
+    '''
+    Return values of parameter param converted to mg/L (see LOAD_CONVERSIONS)
+
+    Parameters
+    ----------
+    values : Series or array
+        Values of a single parameter in its reported units
+    param: str
+        The parameter of values (e.g., 'turbidity')
+
+    Returns
+    -------
+    converted : Series or array
+        values in mg/L
+    '''
+    conversion = LOAD_CONVERSIONS.get(param, 1.)
+    
+    
+    if callable(conversion):
+        return conversion(values)
+    return values*conversion
+
 
 def calc_nutrient_load(df, param: str):
     '''
-    Return df with new column containing calculated nutrient load values
+    Add a column containing calculated nutrient load values to df (in place)
+    and return it
 
     Parameters
     ----------
@@ -76,34 +214,56 @@ def calc_nutrient_load(df, param: str):
                                         parameter for unit consistency)
     Returns
     -------
-    df_out : DataFrame
+    df : DataFrame
         df with additional nutrient load column
 
     '''
-    df_out = df.copy()
+    df['load'] = convert_to_mg_per_l(df['value'], param)*df['discharge']
     
-    # Unit conversions for parameters not listed in mg/L units
-    if param == 'turbidity':
-        # Convert turbidity units from NTU to mg/L
-        df_out['value_converted'] = df_out['value']/3.
-        df_out['load'] = df_out['value_converted']*df_out['discharge']
-        df_out.drop(columns=['value_converted'], inplace=True)  
-    # if param == 'total_dissolved_solids':
-        # Convert total dissolved solids units from ppt to mg/L
-        # ... Add some code here and uncomment when we need tds eventually...
-    else: 
-        # This calculation assumes that parameter units are mg/L
-        df_out['load'] = df_out['value']*df_out['discharge']
     
+    return df
+
+
+def calc_loads(df):
+    '''
+    Add a column containing calculated nutrient load values to df (in place)
+    for all parameters at once and return it. The feature functions reuse 
+    this column instead of computing loads per parameter
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive Dataset, any number of parameters
+
+    Returns
+    -------
+    df : DataFrame
+        df with additional nutrient load column
+
+    '''
+    # Label each row with its parameter once, then convert the values of 
+        # each registered parameter (rows of other parameters are in mg/L)
+    codes, params = pd.factorize(df['parameter'])
+    values = df['value'].to_numpy(dtype=float, copy=True)
+    for code, param in enumerate(params):
+        if param in LOAD_CONVERSIONS:
+            is_param = codes == code
+            values[is_param] = convert_to_mg_per_l(values[is_param], param)
     
-    return df_out
+    
+    df['load'] = values*df['discharge'].to_numpy(dtype=float)
+    
+    
+    return df
 
 
 #==========================Feature Creation Functions==========================
 
 
 def calc_discharge_site_features_hrs_ago(df, site: str, hours_ago_start: int,
-                                         hours_ago_end: int):
+                                         hours_ago_end: int, 
+                                         regular_grid: bool = False,
+                                         return_gaps: bool = False):
     '''
     Return dataset containing calculated discharge features for site site
     records in df for hours_ago_start-hours_ago_end hours ago bucket
@@ -118,13 +278,27 @@ def calc_discharge_site_features_hrs_ago(df, site: str, hours_ago_start: int,
         The start of time bucket (e.g., 4 for 4-6h ago time bucket)
     hours_ago_end : int
         The end of time bucket (e.g., 6 for 4-6h ago time bucket)
+    regular_grid : bool
+        If True, resample discharge onto a regular hourly grid first (see
+        resample_hourly) so buckets are exact in hours even when records are
+        irregular or missing; one output row per hour. Default False
+    return_gaps : bool
+        If True (requires regular_grid), also return the hourly gap marker 
+        of resample_hourly as a table with a dschrg_<site>_gap column, True 
+        for hours without records. Default False
 
     Returns
     -------
     final_df: Dataframe
         Dataset containing desired features
+    gaps: DataFrame
+        Hourly gap markers, only if return_gaps
 
     '''
+    if return_gaps and not regular_grid:
+        raise ValueError('return_gaps requires regular_grid=True')
+    
+    
     # Make copy of original dataset to avoid modifying it
     data_out = df.copy()
     
@@ -141,29 +315,36 @@ def calc_discharge_site_features_hrs_ago(df, site: str, hours_ago_start: int,
     data_out = data_out.sort_values('timestamp_ccentral', ascending=True)
     
     
-    # Calculate number of records in hours-ago range
-    hours_offset = (hours_ago_end - hours_ago_start) + 1
+    if regular_grid:
+        # Fixed-stride bucket statistics over the hourly grid
+        hourly = resample_hourly(data_out, ['discharge'])
+        mean, min_, max_, max_min = calc_hourly_bucket_stats(
+            hourly['discharge'], hours_ago_start, hours_ago_end)
     
+    else:
+        # Calculate number of records in hours-ago range
+        hours_offset = (hours_ago_end - hours_ago_start) + 1
     
-    # Create rolling windows for hours_offset bucket
-    rolling_window = data_out[['discharge', 'timestamp_ccentral']].rolling(
-                     window=str(hours_offset)+'h', 
-                     on='timestamp_ccentral',
-                     min_periods=1, 
-                     closed='left')
     
+        # Create rolling windows for hours_offset bucket
+        rolling_window = data_out[['discharge', 'timestamp_ccentral']].rolling(
+                         window=str(hours_offset)+'h', 
+                         on='timestamp_ccentral',
+                         min_periods=1, 
+                         closed='left')
     
-    # Calculate the number of positions to shift depending on hours-ago range
-    shift_scalar = hours_ago_start//hours_offset
-    shift_num = shift_scalar*hours_offset
     
+        # Calculate the number of positions to shift depending on hours-ago range
+        shift_scalar = hours_ago_start//hours_offset
+        shift_num = shift_scalar*hours_offset
     
-    # Calculate mean, max, min, and max-min range for discharge
-        # Not calculating variance since windows are too small
-    mean = rolling_window['discharge'].mean().shift(shift_num)
-    min_ = rolling_window['discharge'].min().shift(shift_num)
-    max_ = rolling_window['discharge'].max().shift(shift_num)
-    max_min = abs(max_ - min_)
+    
+        # Calculate mean, max, min, and max-min range for discharge
+            # Not calculating variance since windows are too small
+        mean = rolling_window['discharge'].mean().shift(shift_num)
+        min_ = rolling_window['discharge'].min().shift(shift_num)
+        max_ = rolling_window['discharge'].max().shift(shift_num)
+        max_min = abs(max_ - min_)
     
     
     #  Add new columns with calculated features
@@ -179,14 +360,22 @@ def calc_discharge_site_features_hrs_ago(df, site: str, hours_ago_start: int,
            ]
     
     final_df.columns = cols
-    final_df.loc[:, 'timestamp_ccentral'] = data_out['timestamp_ccentral']
-    
+    if regular_grid:
+        final_df.loc[:, 'timestamp_ccentral'] = final_df.index
+        final_df = final_df.reset_index(drop=True)
+    else:
+        final_df.loc[:, 'timestamp_ccentral'] = data_out['timestamp_ccentral']
+    
+    if return_gaps:
+        return final_df, get_gap_table(hourly, 'dschrg_'+site+'_gap')
     return final_df
     
                 
     
 def calc_param_site_features_hrs_ago(df, param: str, site: str,
-                                     hours_ago_start: int, hours_ago_end: int):
+                                     hours_ago_start: int, hours_ago_end: int,
+                                     regular_grid: bool = False,
+                                     return_gaps: bool = False):
     '''
     Return datasets containing calculated features for parameter param and 
     site site records in df for hours_ago_start-hours_ago_end hours ago bucket
@@ -203,58 +392,82 @@ def calc_param_site_features_hrs_ago(df, param: str, site: str,
         The start of time bucket (e.g., 4 for 4-6h ago time bucket)
     hours_ago_end: int
         The end of time bucket (e.g., 6 for 4-6h ago time bucket)
+    regular_grid: bool
+        If True, resample concentration and load onto a regular hourly grid 
+        first (see resample_hourly) so buckets are exact in hours even when 
+        records are irregular, duplicated or missing; one output row per hour. 
+        Default False
+    return_gaps: bool
+        If True (requires regular_grid), also return the hourly gap marker 
+        of resample_hourly as a table with a <param>_<site>_gap column, True 
+        for hours without records. Default False
 
     Returns
     -------
     final_df_conc, final_df_load: Tuple of two DataFrames
         First dataframe is feature table for nutrient concentration
         Second dataframe is feature table for nutrient load
+        (followed by a third with the hourly gap markers, only if return_gaps)
 
     '''
-    # Make copy of original dataset to avoid modifying it
-    data_out = df.copy()
+    if return_gaps and not regular_grid:
+        raise ValueError('return_gaps requires regular_grid=True')
+    
+    
+    # Filter for parameter and site (a new frame, so df isn't modified)
+    data_out = filter_for_param_site(df, param, site)
     
     
-    # Filter for parameter and site and create datetime type timestamp column 
-        # (Canada Central)
-    data_out = convert_timestamps(calc_nutrient_load(
-            filter_for_param_site(data_out, param, site), param))
+    # Calculate loads unless df already has them (see calc_loads) and create 
+        # datetime type timestamp column (Canada Central)
+    if 'load' not in data_out.columns:
+        data_out = calc_nutrient_load(data_out, param)
+    data_out = convert_timestamps(data_out)
     
     
     # Sort timestamps in ascending order
     data_out = data_out.sort_values('timestamp_ccentral', ascending=True)
     
     
-    # Calculate number of records in hours-ago range
-    hours_offset = (hours_ago_end - hours_ago_start) + 1
+    if regular_grid:
+        # Fixed-stride bucket statistics over the hourly grid
+        hourly = resample_hourly(data_out, ['value', 'load'])
+        mean, min_, max_, max_min = calc_hourly_bucket_stats(
+            hourly['value'], hours_ago_start, hours_ago_end)
+        mean_load, min_load, max_load, max_min_load = calc_hourly_bucket_stats(
+            hourly['load'], hours_ago_start, hours_ago_end)
     
+    else:
+        # Calculate number of records in hours-ago range
+        hours_offset = (hours_ago_end - hours_ago_start) + 1
     
-    # Create rolling windows for hours_offset bucket
-    rolling_window = data_out[['value', 'load', 'timestamp_ccentral']].rolling(
-                     window=str(hours_offset)+'h', 
-                     on='timestamp_ccentral',
-                     min_periods=1, 
-                     closed = 'left')
     
-    # Calculate the number of positions to shift depending on hours-ago range
-    shift_scalar = hours_ago_start//hours_offset
-    shift_num = shift_scalar*hours_offset
+        # Create rolling windows for hours_offset bucket
+        rolling_window = data_out[['value', 'load', 'timestamp_ccentral']].rolling(
+                         window=str(hours_offset)+'h', 
+                         on='timestamp_ccentral',
+                         min_periods=1, 
+                         closed = 'left')
     
+        # Calculate the number of positions to shift depending on hours-ago range
+        shift_scalar = hours_ago_start//hours_offset
+        shift_num = shift_scalar*hours_offset
     
-    # Calculate mean, max, min, and max-min range for param concentration
-        # Not calculating variance since windows are too small
-    mean = rolling_window['value'].mean().shift(shift_num)
-    min_ = rolling_window['value'].min().shift(shift_num)
-    max_ = rolling_window['value'].max().shift(shift_num)
-    max_min = abs(max_ - min_)
+    
+        # Calculate mean, max, min, and max-min range for param concentration
+            # Not calculating variance since windows are too small
+        mean = rolling_window['value'].mean().shift(shift_num)
+        min_ = rolling_window['value'].min().shift(shift_num)
+        max_ = rolling_window['value'].max().shift(shift_num)
+        max_min = abs(max_ - min_)
     
     
-    # Calculate mean, max, min, and max-min range for param load
-        # Not calculating variance since windows are too small
-    mean_load = rolling_window['load'].mean().shift(shift_num)
-    min_load = rolling_window['load'].min().shift(shift_num)
-    max_load = rolling_window['load'].max().shift(shift_num)
-    max_min_load = abs(max_load - min_load)
+        # Calculate mean, max, min, and max-min range for param load
+            # Not calculating variance since windows are too small
+        mean_load = rolling_window['load'].mean().shift(shift_num)
+        min_load = rolling_window['load'].min().shift(shift_num)
+        max_load = rolling_window['load'].max().shift(shift_num)
+        max_min_load = abs(max_load - min_load)
     
     
     #  Add new columns with calculated features for concentration and load
@@ -283,11 +496,19 @@ def calc_param_site_features_hrs_ago(df, param: str, site: str,
     
     
     # Add timestamp column
-    final_df_conc.loc[:, 'timestamp_ccentral'] = data_out['timestamp_ccentral']
-    final_df_load.loc[:, 'timestamp_ccentral'] = data_out['timestamp_ccentral']
+    if regular_grid:
+        final_df_conc.loc[:, 'timestamp_ccentral'] = final_df_conc.index
+        final_df_load.loc[:, 'timestamp_ccentral'] = final_df_load.index
+        final_df_conc = final_df_conc.reset_index(drop=True)
+        final_df_load = final_df_load.reset_index(drop=True)
+    else:
+        final_df_conc.loc[:, 'timestamp_ccentral'] = data_out['timestamp_ccentral']
+        final_df_load.loc[:, 'timestamp_ccentral'] = data_out['timestamp_ccentral']
     
     
     # return a tuple of two separate dataframes, one concentration one load
+    if return_gaps:
+        return final_df_conc, final_df_load, get_gap_table(hourly, param+'_'+site+'_gap')
     return final_df_conc, final_df_load
     
 
@@ -0,0 +1,258 @@
+import json
+import numpy as np
+import pandas as pd
+from typing import Union
+from joblib import Memory
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+from sklearn.base import BaseEstimator
+from sklearn.feature_selection import SelectorMixin, VarianceThreshold, mutual_info_regression, f_regression
+from sklearn.utils.validation import check_array, check_is_fitted
+
+class CorrelationFilter(SelectorMixin, BaseEstimator):
+    """
+    Drops features that are highly correlated with an earlier feature.
+
+    Uses the Pearson correlations of the fold's training data after imputation, so they are computed
+    on every row and differ from the pairwise-complete correlation matrix of perform_eda (mean imputation
+    shrinks them towards zero). Columns are visited in order and a column is kept only if its absolute
+    correlation with every column kept so far is at most threshold.
+
+    Args:
+        threshold (float, optional): The absolute correlation above which a feature is dropped. Defaults to 0.95.
+    """
+
+    def __init__(self, threshold: float = 0.95):
+        self.threshold = threshold
+
+    def fit(self, X, y=None):
+        """
+        Finds the features to keep.
+
+        Args:
+            X (numpy.ndarray): The training data features, without missing values.
+            y (numpy.ndarray, optional): Unused.
+
+        Returns:
+            CorrelationFilter: The fitted filter.
+        """
+        X = check_array(X)
+        self.n_features_in_ = X.shape[1]
+
+        # Constant columns have no defined correlation; the variance step removes those
+        correlation = np.abs(np.nan_to_num(np.corrcoef(X, rowvar=False)))
+        correlation = np.atleast_2d(correlation)
+
+        support = np.zeros(X.shape[1], dtype=bool)
+        for column in range(X.shape[1]):
+            support[column] = not (correlation[column, support] > self.threshold).any()
+        self.support_ = support
+
+        return self
+
+    def _get_support_mask(self) -> np.ndarray:
+        check_is_fitted(self)
+
+        return self.support_
+
+
+class RankedFeatureSelector(SelectorMixin, BaseEstimator):
+    """
+    Keeps the k features with the highest importance score.
+
+    The scores only depend on the training data, not on k or the estimator parameters, so when memory
+    is set they are computed once per fold and every grid point reuses the cached ranking.
+
+    Args:
+        k (int or str, optional): The number of features to keep, or 'all'. Defaults to 'all'.
+        method (str, optional): The importance score, 'mutual_info' or 'f_regression'. Defaults to 'mutual_info'.
+        memory (str, optional): A directory used to cache the feature rankings. Defaults to None.
+        random_state (int, optional): The random state of the mutual information estimate. Defaults to 0.
+    """
+
+    def __init__(self, k: Union[int, str] = 'all', method: str = 'mutual_info',
+                 memory: Union[None, str] = None, random_state: int = 0):
+        self.k = k
+        self.method = method
+        self.memory = memory
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        """
+        Ranks the features and finds the k best.
+
+        Args:
+            X (numpy.ndarray): The training data features, without missing values.
+            y (numpy.ndarray): The training data labels, one column per target for multi-output models.
+
+        Returns:
+            RankedFeatureSelector: The fitted selector.
+        """
+        X = check_array(X)
+        self.n_features_in_ = X.shape[1]
+
+        score_features_cached = Memory(self.memory, verbose=0).cache(score_features)
+        self.scores_ = score_features_cached(X, np.asarray(y), self.method, self.random_state)
+
+        return self
+
+    def _get_support_mask(self) -> np.ndarray:
+        check_is_fitted(self)
+
+        n_features = len(self.scores_)
+        k = n_features if self.k == 'all' else min(self.k, n_features)
+        support = np.zeros(n_features, dtype=bool)
+        support[np.argsort(-self.scores_, kind='stable')[:k]] = True
+
+        return support
+
+
+def score_features(X: np.ndarray, y: np.ndarray, method: str = 'mutual_info',
+                   random_state: int = 0) -> np.ndarray:
+    """
+    Returns an importance score for each feature. For several targets the scores are averaged.
+
+    Args:
+        X (numpy.ndarray): The training data features, without missing values.
+        y (numpy.ndarray): The training data labels.
+        method (str, optional): 'mutual_info' for mutual information or 'f_regression' for the F-statistic
+            of a univariate linear fit. Defaults to 'mutual_info'.
+        random_state (int, optional): The random state of the mutual information estimate. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: The score of each feature, higher is more important.
+    """
+    targets = y.reshape(len(y), -1)
+
+    scores = np.zeros(X.shape[1])
+    for target in targets.T:
+        if method == 'mutual_info':
+            scores += mutual_info_regression(X, target, random_state=random_state)
+        elif method == 'f_regression':
+            scores += np.nan_to_num(f_regression(X, target)[0])
+        else:
+            raise ValueError(f"Unknown method '{method}', expected 'mutual_info' or 'f_regression'")
+
+    return scores / targets.shape[1]
+
+
+def prune_correlated_features(correlation_matrix: pd.DataFrame, threshold: float = 0.95,
+                              missing_values: Union[None, pd.Series] = None) -> dict:
+    """
+    Groups highly correlated features into clusters and keeps one representative per cluster.
+
+    Features are clustered by complete linkage on the distance 1 - |correlation|, so every pair of features in
+    a cluster has an absolute correlation of at least threshold. Unlike CorrelationFilter, which is fitted
+    inside every fold, this runs once on a correlation matrix such as the one from perform_eda, and the result
+    is a fixed mapping that is recorded and applied in the same way at training and inference.
+
+    Args:
+        correlation_matrix (pandas.DataFrame): A square correlation matrix of the candidate features.
+        threshold (float, optional): The absolute correlation at or above which features are merged. Defaults to 0.95.
+        missing_values (pandas.Series, optional): The number of missing values of each feature, e.g. the
+            missing_values column of perform_eda. The feature with the fewest is kept; ties, or no missing_values,
+            keep the first in column order. Defaults to None.
+
+    Returns:
+        dict: The kept features, in column order, each mapped to the list of features it represents.
+    """
+    names = list(correlation_matrix.columns)
+    if len(names) < 2:
+        return {name: [] for name in names}
+
+    # Undefined correlations (constant features) count as uncorrelated
+    distance = 1 - np.abs(np.nan_to_num(correlation_matrix.loc[names, names].to_numpy(dtype=float)))
+    distance = np.clip((distance + distance.T) / 2, 0, 1)
+    np.fill_diagonal(distance, 0)
+    clusters = fcluster(linkage(squareform(distance), method='complete'), t=1 - threshold, criterion='distance')
+
+    if missing_values is None:
+        missing = np.zeros(len(names))
+    else:
+        missing = missing_values.reindex(names).fillna(0).to_numpy()
+
+    mapping = {}
+    for cluster in np.unique(clusters):
+        members = np.flatnonzero(clusters == cluster)
+        kept = members[np.argmin(missing[members])]
+        mapping[names[kept]] = [names[member] for member in members if member != kept]
+
+    return {name: mapping[name] for name in names if name in mapping}
+
+
+def save_feature_pruning(mapping: dict, path: str) -> None:
+    """
+    Saves a kept-to-dropped feature mapping from prune_correlated_features as JSON.
+
+    Args:
+        mapping (dict): The mapping to save.
+        path (str): The file to write.
+    """
+    with open(path, 'w') as file:
+        json.dump(mapping, file, indent=2)
+
+
+def load_feature_pruning(path: str) -> dict:
+    """
+    Loads a kept-to-dropped feature mapping saved by save_feature_pruning.
+
+    Args:
+        path (str): The file to read.
+
+    Returns:
+        dict: The kept features, in order, each mapped to the list of features it represents.
+    """
+    with open(path) as file:
+        return json.load(file)
+
+
+def apply_feature_pruning(X: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    """
+    Keeps the representative features of a pruning mapping, in mapping order.
+
+    Args:
+        X (pandas.DataFrame): The features, with at least every kept feature as a column.
+        mapping (dict): A mapping from prune_correlated_features or load_feature_pruning.
+
+    Returns:
+        pandas.DataFrame: The kept columns of X.
+    """
+    return X[list(mapping)]
+
+
+def get_rf_feature_selection_pipeline(memory: Union[None, str] = None) -> list:
+    """
+    Returns the feature selection steps of the random forest pipeline: constant features are dropped,
+    then highly correlated features, then all but the top-k ranked features.
+
+    Args:
+        memory (str, optional): A directory used to cache the feature rankings. Defaults to None.
+
+    Returns:
+        list: A list of (name, transformer) pipeline steps.
+    """
+    return [
+        ('variance', VarianceThreshold()),
+        ('correlation', CorrelationFilter()),
+        ('selector', RankedFeatureSelector(memory=memory)),
+    ]
+
+
+def get_rf_feature_selection_grid(n_features: Union[None, int] = None) -> dict:
+    """
+    Returns a dictionary of feature selection hyperparameters that is used in a grid search.
+
+    Args:
+        n_features (int, optional): The number of input features. Values of k that would keep all of them
+            are left out, since they fit the same model as 'all'. Defaults to None.
+
+    Returns:
+        dict: A dictionary of feature selection hyperparameters.
+    """
+    k_values = [20, 40]
+    if n_features is not None:
+        k_values = [k for k in k_values if k < n_features]
+
+    return {
+        'selector__k': k_values + ['all'],
+    }
@@ -0,0 +1,67 @@
+from typing import Union
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.feature_selection import VarianceThreshold
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+
+def get_hgb_pipeline(memory: Union[None, str] = None, multi_target: bool = False) -> Pipeline:
+    """
+    Returns a pipeline for training a histogram-binned gradient boosting model.
+
+    The model bins every feature into at most 255 levels once per fit and grows each tree on the
+    bins, and it routes missing values natively, so unlike get_rf_pipeline there is no imputer and
+    the NaNs at data gaps are kept as information.
+
+    Args:
+        memory (str, optional): A directory used to cache the fitted preprocessing steps. Defaults to None.
+        multi_target (bool, optional): If True, one model is fitted per target column. Defaults to False.
+
+    Returns:
+        sklearn.pipeline.Pipeline: A pipeline for training a gradient boosting model.
+    """
+    estimator = HistGradientBoostingRegressor(early_stopping=True, random_state=0)
+    if multi_target:
+        estimator = MultiOutputRegressor(estimator)
+
+    pipeline_steps = [
+        ('variance', VarianceThreshold()),
+        ('estimator', estimator),
+    ]
+
+    return Pipeline(pipeline_steps, memory=memory)
+
+def get_hgb_grid(multi_target: bool = False) -> dict:
+    """
+    Returns a dictionary of hyperparameters to use for training a gradient boosting model that
+    is used in a grid search.
+
+    Args:
+        multi_target (bool, optional): If True, the names address the per-target models of a
+            pipeline from get_hgb_pipeline(multi_target=True). Defaults to False.
+
+    Returns:
+        dict: A dictionary of hyperparameters to use for training a gradient boosting model.
+    """
+    hgb_grid = get_hgb_model_grid()
+    if multi_target:
+        hgb_grid = {name.replace('estimator__', 'estimator__estimator__', 1): values
+                    for name, values in hgb_grid.items()}
+
+    return hgb_grid
+
+def get_hgb_model_grid() -> dict:
+    """
+    Returns a dictionary of hyperparameters to use for training a gradient boosting model that
+    is used in a grid search. The number of boosting iterations is not searched; early stopping
+    on a validation split picks it within max_iter.
+
+    Returns:
+        dict: A dictionary of hyperparameters to use for training a gradient boosting model.
+    """
+    return {
+        'estimator__max_iter': [500],
+        'estimator__learning_rate': [0.05, 0.1],
+        'estimator__max_leaf_nodes': [15, 31, 63],
+        'estimator__min_samples_leaf': [10, 20],
+        'estimator__l2_regularization': [0.0, 1.0],
+    }
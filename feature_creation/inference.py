@@ -0,0 +1,180 @@
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+from typing import Union
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+
+def export_rf_artifact(pipeline: Pipeline, path: str, feature_names: Union[None, list] = None) -> None:
+    """
+    Exports a fitted random forest pipeline to a compact .npz artifact for CompiledForest.
+
+    The imputer statistics and the columns kept by the feature selection steps are folded into one
+    list of input columns and their fill values. Every tree is flattened into contiguous node arrays
+    (children, split feature, threshold and leaf value), dropping the training-only node statistics
+    that sklearn keeps.
+
+    Args:
+        pipeline (sklearn.pipeline.Pipeline): A fitted pipeline from get_rf_pipeline.
+        path (str): The file to write, conventionally ending in .npz.
+        feature_names (list, optional): The names of the pipeline's input columns, in order. Needed to
+            predict from DataFrames with CompiledForest. Defaults to the names seen during fit, if any.
+    """
+    estimator = pipeline.named_steps['estimator']
+    if not isinstance(estimator, RandomForestRegressor):
+        raise ValueError('Only random forest pipelines can be exported, got ' + type(estimator).__name__)
+
+    # The imputer drops columns that were entirely missing during fit
+    statistics = pipeline.named_steps['imputer'].statistics_
+    columns = np.flatnonzero(~np.isnan(statistics))
+    for _, step in pipeline.steps[1:-1]:
+        if step not in (None, 'passthrough'):
+            columns = columns[step.get_support()]
+
+    trees = [tree.tree_ for tree in estimator.estimators_]
+    node_counts = np.array([tree.node_count for tree in trees])
+    roots = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+
+    left, right, feature, threshold, value = [], [], [], [], []
+    for root, tree in zip(roots, trees):
+        is_leaf = tree.children_left == -1
+        nodes = root + np.arange(tree.node_count)
+        # Leaves point to themselves, which is how CompiledForest recognises them
+        left.append(np.where(is_leaf, nodes, root + tree.children_left))
+        right.append(np.where(is_leaf, nodes, root + tree.children_right))
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        value.append(tree.value[:, :, 0])
+
+    if feature_names is None:
+        feature_names = getattr(pipeline, 'feature_names_in_', [])
+
+    np.savez_compressed(
+        path,
+        columns=columns.astype(np.int32),
+        fill_values=statistics[columns],
+        roots=roots.astype(np.int32),
+        left=np.concatenate(left).astype(np.int32),
+        right=np.concatenate(right).astype(np.int32),
+        feature=np.concatenate(feature).astype(np.int32),
+        threshold=np.concatenate(threshold),
+        value=np.concatenate(value),
+        feature_names=np.array(feature_names, dtype=str),
+    )
+
+
+class CompiledForest:
+    """
+    Batch predictor for a random forest artifact written by export_rf_artifact.
+
+    Every tree is evaluated over a block of rows at once: all (row, tree) pairs that have not reached
+    a leaf descend one level per step with vectorized lookups into the flattened node arrays.
+    Predictions match the sklearn pipeline the artifact was exported from.
+
+    Args:
+        path (str): The artifact written by export_rf_artifact.
+        batch_size (int, optional): The number of rows evaluated per block, bounding the memory used
+            by the (row, tree) node arrays. Defaults to 4096.
+    """
+
+    def __init__(self, path: str, batch_size: int = 4096):
+        with np.load(path) as artifact:
+            self.columns = artifact['columns']
+            self.fill_values = artifact['fill_values'].astype(np.float32)
+            self.roots = artifact['roots']
+            self.left = artifact['left']
+            self.right = artifact['right']
+            self.feature = artifact['feature']
+            self.threshold = artifact['threshold']
+            self.value = artifact['value']
+            self.feature_names = list(artifact['feature_names'])
+        self.is_leaf = self.left == np.arange(len(self.left))
+        self.batch_size = batch_size
+
+    def predict(self, X: Union[np.ndarray, pd.DataFrame]) -> np.ndarray:
+        """
+        Predicts the targets of every row of X.
+
+        Args:
+            X (numpy.ndarray): The features, with the same columns as the exported pipeline's input. A
+                DataFrame is first reordered to the exported feature names.
+
+        Returns:
+            numpy.ndarray: The predictions, 1D for a single target and 2D otherwise.
+        """
+        if isinstance(X, pd.DataFrame) and self.feature_names:
+            X = X[self.feature_names]
+
+        # Like the forest, compare float32 features against the float64 thresholds
+        X = np.asarray(X)[:, self.columns].astype(np.float32)
+        X = np.where(np.isnan(X), self.fill_values, X)
+
+        prediction = np.concatenate([self._predict_batch(X[start:start + self.batch_size])
+                                     for start in range(0, len(X), self.batch_size)])
+
+        return prediction[:, 0] if prediction.shape[1] == 1 else prediction
+
+    def _predict_batch(self, X: np.ndarray) -> np.ndarray:
+        n_rows, n_trees = len(X), len(self.roots)
+        values = X.ravel()
+        nodes = np.tile(self.roots, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows) * X.shape[1], n_trees)
+
+        # Only (row, tree) pairs that have not reached a leaf take another step
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while len(active):
+            current = nodes[active]
+            go_left = values[row_offsets[active] + self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[~self.is_leaf[nodes[active]]]
+
+        return self.value[nodes].reshape(n_rows, n_trees, -1).mean(axis=1)
+
+
+def benchmark_inference(pipeline: Pipeline, artifact_path: str, X: Union[np.ndarray, pd.DataFrame],
+                        n_single: int = 200) -> pd.DataFrame:
+    """
+    Compares sklearn's predict with CompiledForest on the same rows.
+
+    Args:
+        pipeline (sklearn.pipeline.Pipeline): The fitted pipeline the artifact was exported from.
+        artifact_path (str): The artifact written by export_rf_artifact.
+        X (numpy.ndarray): The rows to predict, in the pipeline's input format.
+        n_single (int, optional): The number of single-row predictions timed. Defaults to 200.
+
+    Returns:
+        pandas.DataFrame: Single-row p50/p99 latency, batch latency and model size for each predictor,
+            and the largest absolute difference between their predictions.
+    """
+    compiled = CompiledForest(artifact_path)
+    predictors = {'sklearn': pipeline.predict, 'compiled': compiled.predict}
+    sizes = {'sklearn': len(pickle.dumps(pipeline)), 'compiled': os.path.getsize(artifact_path)}
+
+    results = {}
+    for name, predict in predictors.items():
+        single_row_times = []
+        for i in range(n_single):
+            row = X[i % len(X):i % len(X) + 1]
+            start = time.perf_counter()
+            predict(row)
+            single_row_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        prediction = predict(X)
+        batch_time = time.perf_counter() - start
+
+        results[name] = {
+            'single_row_p50_ms': np.percentile(single_row_times, 50) * 1e3,
+            'single_row_p99_ms': np.percentile(single_row_times, 99) * 1e3,
+            'batch_ms': batch_time * 1e3,
+            'size_bytes': sizes[name],
+            'prediction': prediction,
+        }
+
+    max_difference = np.max(np.abs(results['sklearn'].pop('prediction') - results['compiled'].pop('prediction')))
+    benchmark = pd.DataFrame(results).transpose()
+    benchmark['max_abs_difference'] = max_difference
+
+    return benchmark
@@ -0,0 +1,318 @@
+"""
+CODE PURPOSE: Estimate travel-time lags between AquaHive stations with
+              FFT-based cross-correlation and create lagged upstream features
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from stations import STATIONS, get_lag_feature_files
+from feature_creation_adaptive_monitoring import (filter_for_param_site, convert_timestamps, resample_hourly, calc_loads,
+                                                  calc_discharge_site_features_hrs_ago, calc_param_site_features_hrs_ago)
+
+#=============================Formatting functions=============================
+
+def get_hourly_series(df, param: str, site: str):
+    '''
+    Return the hourly averaged series of parameter param at site site, NaN
+    for hours without records
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset
+    param : str
+        The parameter (e.g., 'turbidity'), or 'discharge' for site discharge
+    site : str
+        The site to filter for (e.g., 'wmth' for Whitemouth)
+
+    Returns
+    -------
+    series : Series
+        Hourly values indexed by the start of each hour (Canada/Central)
+    '''
+    if param == 'discharge':
+        data = convert_timestamps(df[df['site'] == site])
+        data = data.drop_duplicates(subset=['timestamp_ccentral'])
+        column = 'discharge'
+    else:
+        data = convert_timestamps(filter_for_param_site(df, param, site))
+        column = 'value'
+
+
+    return resample_hourly(data, [column])[column]
+
+
+def calc_hourly_records(df):
+    '''
+    Reduce AquaHive records to one record per site, parameter and hour with
+    the hourly means of value, load and discharge (discharge once per
+    timestamp of the site, as in calc_discharge_site_features_hrs_ago).
+    Lags and lag features only depend on hourly means, so they are the same
+    for these records as for df, and records of different hours can be
+    reduced separately (see create_upstream_lag_features_partitioned)
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset
+
+    Returns
+    -------
+    records : DataFrame
+        Hourly AquaHive records, timestamp being the start of the hour (UTC)
+    '''
+    if 'load' not in df.columns:
+        df = calc_loads(df.copy())
+    times = pd.to_datetime(df['timestamp'], utc=True)
+    hours = times.dt.floor('h').rename('timestamp')
+
+
+    # Hourly discharge of each site over its distinct timestamps
+    first = ~pd.concat([df['site'], times], axis=1).duplicated()
+    discharge = df['discharge'][first].groupby([df['site'][first], hours[first]]).mean()
+
+
+    records = (df.groupby([df['site'], df['parameter'], hours])[['value', 'load']]
+                 .mean().reset_index())
+    records['discharge'] = discharge.reindex(
+        pd.MultiIndex.from_frame(records[['site', 'timestamp']])).to_numpy()
+
+
+    return records
+
+
+#===============================Lag estimation=================================
+
+def calc_cross_correlation(upstream, downstream, max_lag_hours: int,
+                           min_overlap_hours: int = 24):
+    '''
+    Return the Pearson correlation between upstream and downstream shifted by
+    0 to max_lag_hours hours, each over the hours where both series have
+    values at that lag, computed for all lags at once with FFTs
+
+    Parameters
+    ----------
+    upstream : Series
+        Hourly upstream series (see get_hourly_series)
+    downstream : Series
+        Hourly downstream series (see get_hourly_series)
+    max_lag_hours : int
+        The largest lag to evaluate (e.g., 336 for two weeks)
+    min_overlap_hours : int
+        Lags with fewer hours where both series have values (or where
+        either is constant over them) are NaN. Default 24
+
+    Returns
+    -------
+    correlation : Series
+        Correlation of upstream at hour t with downstream at hour t+lag,
+        indexed by lag in hours
+    '''
+    # Align both series on one hourly grid
+    index = upstream.index.union(downstream.index)
+    x = upstream.reindex(index).to_numpy(dtype=float)
+    y = downstream.reindex(index).to_numpy(dtype=float)
+
+
+    # Standardize (only to keep the sums well conditioned) and zero gaps so
+        # they add nothing to the sums
+    x_mask, y_mask = ~np.isnan(x), ~np.isnan(y)
+    x = np.where(x_mask, (x - np.nanmean(x))/np.nanstd(x), 0.)
+    y = np.where(y_mask, (y - np.nanmean(y))/np.nanstd(y), 0.)
+
+
+    # Zero-pad to avoid circular wrap-around, then get every lagged sum via FFTs
+    n_fft = 1 << int(2*len(index) - 1).bit_length()
+
+    def lagged_sums(a, b):
+        spectrum = np.conj(np.fft.rfft(a, n_fft))*np.fft.rfft(b, n_fft)
+        return np.fft.irfft(spectrum, n_fft)[:max_lag_hours + 1]
+
+
+    # Pearson correlation over the hours where both series have values at
+        # each lag, from the overlap count and the lagged sums of x, y, x^2, 
+        # y^2 and xy restricted to that overlap
+    x_mask, y_mask = x_mask.astype(float), y_mask.astype(float)
+    overlap = np.round(lagged_sums(x_mask, y_mask))
+    sum_x, sum_y = lagged_sums(x, y_mask), lagged_sums(x_mask, y)
+    sum_xx, sum_yy = lagged_sums(x**2, y_mask), lagged_sums(x_mask, y**2)
+    sum_xy = lagged_sums(x, y)
+
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = sum_xy - sum_x*sum_y/overlap
+        variances = (sum_xx - sum_x**2/overlap)*(sum_yy - sum_y**2/overlap)
+        correlation = np.where((overlap >= min_overlap_hours) & (variances > 0),
+                               np.clip(covariance/np.sqrt(variances), -1., 1.), np.nan)
+
+
+    return pd.Series(correlation, index=pd.RangeIndex(len(correlation), name='lag_hours'))
+
+
+def estimate_lag_hours(df, param: str, upstream_site: str,
+                       downstream_site: str, max_lag_hours: int = 336,
+                       min_overlap_hours: int = 24):
+    '''
+    Return the travel time in hours from upstream_site to downstream_site for
+    parameter param, as the lag with the highest cross-correlation
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset
+    param : str
+        The parameter (e.g., 'turbidity'), or 'discharge'
+    upstream_site : str
+        The upstream site (e.g., 'wmth' for Whitemouth)
+    downstream_site : str
+        The downstream site (e.g., 'pnwa' for Pinawa)
+    max_lag_hours : int
+        The largest lag to search. Default 336 (two weeks)
+    min_overlap_hours : int
+        Passed to calc_cross_correlation. Default 24
+
+    Returns
+    -------
+    lag_hours, correlation: Tuple of int and float
+        The best lag and its correlation
+
+    Raises
+    ------
+    ValueError
+        If the series overlap by fewer than min_overlap_hours at every lag
+    '''
+    correlation = calc_cross_correlation(get_hourly_series(df, param, upstream_site),
+                                         get_hourly_series(df, param, downstream_site),
+                                         max_lag_hours, min_overlap_hours)
+    if correlation.isna().all():
+        raise ValueError(f"Cannot estimate the {param} lag from {upstream_site} to "
+                         f"{downstream_site}: the series overlap by fewer than "
+                         f"{min_overlap_hours} hours at every lag up to {max_lag_hours}")
+    lag_hours = int(correlation.idxmax())
+
+
+    return lag_hours, correlation[lag_hours]
+
+
+#==========================Feature Creation Functions==========================
+
+def calc_upstream_lag_features(df, param: str, upstream_site: str,
+                               lag_hours: int, half_width: int = 1):
+    '''
+    Return features of upstream_site for the hours around a travel-time lag,
+    in the same format as calc_param_site_features_hrs_ago and
+    calc_discharge_site_features_hrs_ago (e.g., turbidity_wmth_mean_19_21 for
+    a 20h lag), on a regular hourly grid so the offsets are exact in hours
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset
+    param : str
+        The parameter (e.g., 'turbidity'), or 'discharge'
+    upstream_site : str
+        The upstream site (e.g., 'wmth' for Whitemouth)
+    lag_hours : int
+        The travel time (see estimate_lag_hours)
+    half_width : int
+        The bucket covers lag_hours-half_width to lag_hours+half_width hours
+        ago. Default 1
+
+    Returns
+    -------
+    features : DataFrame or Tuple of two DataFrames
+        Discharge features, or concentration and load features for other
+        parameters
+    '''
+    hours_ago_start = max(lag_hours - half_width, 1)
+    hours_ago_end = max(lag_hours + half_width, hours_ago_start)
+
+
+    if param == 'discharge':
+        return calc_discharge_site_features_hrs_ago(df=df,
+                                                    site=upstream_site,
+                                                    hours_ago_start=hours_ago_start,
+                                                    hours_ago_end=hours_ago_end,
+                                                    regular_grid=True)
+
+
+    return calc_param_site_features_hrs_ago(df=df,
+                                            param=param,
+                                            site=upstream_site,
+                                            hours_ago_start=hours_ago_start,
+                                            hours_ago_end=hours_ago_end,
+                                            regular_grid=True)
+
+
+def create_upstream_lag_features(df, output_dir: str = '.',
+                                 max_lag_hours: int = 336, half_width: int = 1,
+                                 sites=None):
+    '''
+    Estimate the travel time from every registered station to its downstream
+    station (see STATIONS) for discharge and each shared parameter, and
+    export the upstream features at those lags as csv (see
+    get_lag_feature_files), along with the lags themselves
+    (upstream_lags.csv). Feature columns get a _lag suffix so they stay
+    distinct from the station features of the same buckets
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset
+    output_dir : str
+        Directory to write the csv files to. Default current directory
+    max_lag_hours : int
+        The largest lag to search. Default 336 (two weeks)
+    half_width : int
+        Passed to calc_upstream_lag_features. Default 1
+    sites : list, optional
+        The stations to include; a pair is used only if both its stations
+        are. Default all registered stations
+
+    Returns
+    -------
+    lags : DataFrame
+        One row per upstream site, downstream site and parameter with the
+        lag, its correlation and the exported feature files
+    '''
+    sites = list(sites or STATIONS)
+    rows = []
+    for upstream_site in sites:
+        downstream_site = STATIONS[upstream_site].get('downstream')
+        if downstream_site not in sites:
+            continue
+
+
+        shared_params = [param for param in STATIONS[upstream_site]['parameters']
+                         if param in STATIONS[downstream_site]['parameters']]
+        for param in ['discharge'] + shared_params:
+            lag_hours, correlation = estimate_lag_hours(df, param, upstream_site,
+                                                        downstream_site, max_lag_hours)
+            features = calc_upstream_lag_features(df, param, upstream_site,
+                                                  lag_hours, half_width)
+
+
+            if param == 'discharge':
+                features = [features]
+            files = []
+            for name, table in zip(get_lag_feature_files(param, [upstream_site, downstream_site]),
+                                   features):
+                path = os.path.join(output_dir, name)
+                table.set_index('timestamp_ccentral').add_suffix('_lag').to_csv(path, index=True)
+                files.append(path)
+
+
+            rows.append({'upstream_site': upstream_site,
+                         'downstream_site': downstream_site,
+                         'parameter': param,
+                         'lag_hours': lag_hours,
+                         'correlation': correlation,
+                         'files': ';'.join(files)})
+
+
+    lags = pd.DataFrame(rows)
+    lags.to_csv(os.path.join(output_dir, 'upstream_lags.csv'), index=False)
+
+
+    return lags
@@ -0,0 +1,327 @@
+"""
+CODE PURPOSE: Create station feature tables out of core: stream the AquaHive
+              export into monthly partitions, attach the lookback halo each
+              partition needs from earlier ones, compute the partitions
+              independently in parallel and stitch the results exactly. Upstream
+              lag features are created from the partitions' hourly records
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from stations import (STATIONS, HOUR_BUCKETS, FEATURE_LOOKBACK_HOURS, calc_station_features,
+                      get_param_feature_files, get_discharge_feature_files)
+from lag_discovery import calc_hourly_records, create_upstream_lag_features
+
+#=============================Formatting functions=============================
+
+def partition_export(path: str, partition_dir: str, sites=None,
+                     freq: str = 'M', chunksize: int = 500000):
+    '''
+    Stream the AquaHive export in chunks and split the records of each station
+    into time partitions (one csv per station and period), keeping the order
+    of the export within each partition
+
+    Parameters
+    ----------
+    path : str
+        Path of the AquaHive export csv
+    partition_dir : str
+        Directory to write the partition files to
+    sites : list, optional
+        The stations to keep. Default all registered stations
+    freq : str
+        Period of the partitions in UTC (e.g., 'M' for months). Default 'M'
+    chunksize : int
+        Number of export rows read at a time. Default 500000
+
+    Returns
+    -------
+    partitions : dict
+        Time-ordered list of (period start, partition path) for each station
+    '''
+    sites = list(sites or STATIONS)
+    partitions = {site: {} for site in sites}
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        chunk = chunk[chunk['site'].isin(sites)]
+        periods = pd.to_datetime(chunk['timestamp'], utc=True).dt.tz_localize(None).dt.to_period(freq)
+        for (site, period), records in chunk.groupby([chunk['site'], periods], sort=False):
+            partition_path = os.path.join(partition_dir, site+'_'+period.start_time.strftime('%Y%m%d')+'.csv')
+            records.to_csv(partition_path, mode='a', index=False,
+                           header=period not in partitions[site])
+            partitions[site][period] = partition_path
+
+
+    return {site: [(period.start_time.tz_localize('UTC'), partitions[site][period])
+                   for period in sorted(partitions[site])]
+            for site in sites}
+
+
+#===============================Halo selection=================================
+
+def calc_halo_cutoff(times, start, regular_grid: bool = False):
+    '''
+    Return the earliest record time that features from start onward depend on,
+    for one series (one parameter, or the discharge records of a site)
+
+    Without regular_grid, the bucket statistics shift each rolling window by
+    up to max_shift records, so the halo holds the last max_shift records
+    before start and the window hours before them. With regular_grid, it
+    holds the last record before start (so gap hours after it are covered)
+    and the hours_ago_end hours before its hour
+
+    Parameters
+    ----------
+    times : Series
+        UTC record times of the series before start
+    start : Timestamp
+        Start of the partition (UTC)
+    regular_grid : bool
+        Whether features are computed on the hourly grid. Default False
+
+    Returns
+    -------
+    cutoff : Timestamp or None
+        Records at or after cutoff are needed, None if times is empty
+    '''
+    if len(times) == 0:
+        return None
+
+
+    times = times.sort_values(kind='stable')
+    if regular_grid:
+        return times.iloc[-1].floor('h') - pd.Timedelta(hours=FEATURE_LOOKBACK_HOURS)
+
+
+    hours_offsets = [end - begin + 1 for begin, end in HOUR_BUCKETS]
+    max_shift = max((begin//offset)*offset
+                    for (begin, _), offset in zip(HOUR_BUCKETS, hours_offsets))
+    anchor = times.iloc[-min(max_shift, len(times))] if max_shift else start
+
+
+    return anchor - pd.Timedelta(hours=max(hours_offsets))
+
+
+def select_halo(df, site: str, start, regular_grid: bool = False):
+    '''
+    Return the records of df (all before start) that the features of site
+    from start onward depend on. Each series contributes a suffix of its
+    records, so the halo stays small even if a parameter stops reporting
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive records of site before start, in export order
+    site : str
+        The station (e.g., 'pnwa' for Pinawa)
+    start : Timestamp
+        Start of the partition (UTC)
+    regular_grid : bool
+        Whether features are computed on the hourly grid. Default False
+
+    Returns
+    -------
+    halo : DataFrame
+        Records of df needed as lookback, in export order
+    '''
+    times = pd.to_datetime(df['timestamp'], utc=True)
+
+
+    # Discharge uses every record of the site, once per timestamp
+    cutoff = calc_halo_cutoff(times.drop_duplicates(), start, regular_grid)
+    keep = pd.Series(cutoff is not None, index=df.index)
+    if cutoff is not None:
+        keep &= times >= cutoff
+    for param in STATIONS[site]['parameters']:
+        is_param = df['parameter'] == param
+        cutoff = calc_halo_cutoff(times[is_param], start, regular_grid)
+        if cutoff is not None:
+            keep |= is_param & (times >= cutoff)
+
+
+    return df[keep]
+
+
+#=============================Partition features===============================
+
+def calc_partition_features(partition_path: str, halo_path: str, site: str,
+                            start, output_prefix: str,
+                            regular_grid: bool = False):
+    '''
+    Compute the feature tables of one partition with its halo attached, drop
+    the rows the previous partition already produced and export the rest
+
+    Parameters
+    ----------
+    partition_path : str
+        Partition csv (see partition_export)
+    halo_path : str
+        Halo csv (see select_halo)
+    site : str
+        The station (e.g., 'pnwa' for Pinawa)
+    start : Timestamp
+        Start of the partition (UTC)
+    output_prefix : str
+        Prefix of the exported partial feature files
+    regular_grid : bool
+        Passed to the feature functions (see resample_hourly). Default False
+
+    Returns
+    -------
+    files : dict
+        Partial feature file paths keyed by feature file name
+    '''
+    halo = pd.read_csv(halo_path)
+    halo_times = pd.to_datetime(halo['timestamp'], utc=True)
+    df = pd.concat([halo, pd.read_csv(partition_path)], ignore_index=True)
+
+
+    # Last halo record of each table's series: on the hourly grid the
+        # previous partition produced every hour up to and including its hour
+    last_times = {}
+    for param in STATIONS[site]['parameters']:
+        last_time = halo_times[halo['parameter'] == param].max()
+        for file_name in get_param_feature_files(param, sites=[site]):
+            last_times[file_name] = last_time
+    discharge_file, = get_discharge_feature_files(sites=[site])
+    last_times[discharge_file] = halo_times.max()
+
+
+    files = {}
+    for file_name, table in calc_station_features(df, site, regular_grid).items():
+        if not regular_grid:
+            table = table[table.index >= start]
+        elif not pd.isna(last_times[file_name]):
+            table = table[table.index > last_times[file_name].floor('h')]
+        files[file_name] = output_prefix+file_name
+        table.to_csv(files[file_name], index=True)
+
+
+    return files
+
+
+def create_all_station_features_partitioned(path: str, sites=None,
+                                            output_dir: str = '.',
+                                            regular_grid: bool = False,
+                                            freq: str = 'M',
+                                            chunksize: int = 500000,
+                                            max_workers=None):
+    '''
+    Create and export the feature tables of every station without loading the
+    whole export: the same files as create_all_station_features, from
+    partitions processed in parallel with bounded memory per worker
+
+    Parameters
+    ----------
+    path : str
+        Path of the AquaHive export csv
+    sites : list, optional
+        The stations to process. Default all registered stations
+    output_dir : str
+        Directory to write the csv files to. Default current directory
+    regular_grid : bool
+        Passed to the feature functions (see resample_hourly). Default False
+    freq : str
+        Period of the partitions in UTC (e.g., 'M' for months). Default 'M'
+    chunksize : int
+        Number of export rows read at a time. Default 500000
+    max_workers : int, optional
+        Maximum number of worker processes. Default one per CPU
+
+    Returns
+    -------
+    files : list
+        Paths of the exported csv files
+    '''
+    with tempfile.TemporaryDirectory() as work_dir, \
+         ProcessPoolExecutor(max_workers=max_workers) as executor:
+        partitions = partition_export(path, work_dir, sites, freq, chunksize)
+
+
+        # Halos are built in one pass per station, carrying only the previous
+            # halo and the current partition in memory
+        futures = {}
+        for site, site_partitions in partitions.items():
+            carry = None
+            futures[site] = []
+            for i, (start, partition_path) in enumerate(site_partitions):
+                halo = (select_halo(carry, site, start, regular_grid) if carry is not None
+                        else pd.read_csv(partition_path, nrows=0))
+                halo_path = os.path.join(work_dir, site+'_halo_'+str(i)+'.csv')
+                halo.to_csv(halo_path, index=False)
+                futures[site].append(executor.submit(
+                    calc_partition_features, partition_path, halo_path, site,
+                    start, os.path.join(work_dir, site+'_'+str(i)+'_'), regular_grid))
+                carry = pd.concat([halo, pd.read_csv(partition_path)], ignore_index=True)
+
+
+        # Stitch the partial tables in time order, once every partition
+            # succeeded so a failure leaves no partial set of output files
+        partial_files = {site: [future.result() for future in futures[site]]
+                         for site in partitions}
+        files = []
+        for site in partitions:
+            for file_name in (partial_files[site][0] if partial_files[site] else {}):
+                output_path = os.path.join(output_dir, file_name)
+                with open(output_path, 'w') as output:
+                    for i, partial in enumerate(partial_files[site]):
+                        with open(partial[file_name]) as part:
+                            if i:
+                                next(part)
+                            output.writelines(part)
+                files.append(output_path)
+
+
+    return files
+
+
+def read_hourly_records(partition_path: str):
+    '''
+    Return the hourly records of one partition (see calc_hourly_records)
+    '''
+    return calc_hourly_records(pd.read_csv(partition_path))
+
+
+def create_upstream_lag_features_partitioned(path: str, sites=None,
+                                             output_dir: str = '.',
+                                             freq: str = 'M',
+                                             chunksize: int = 500000,
+                                             max_workers=None):
+    '''
+    Create and export the upstream lag features of create_upstream_lag_features
+    without loading the whole export: partitions are reduced to hourly
+    records in parallel (partitions start on the hour in UTC, so no hour
+    spans two of them) and only the hourly records are kept in memory
+
+    Parameters
+    ----------
+    path : str
+        Path of the AquaHive export csv
+    sites : list, optional
+        The stations to include. Default all registered stations
+    output_dir : str
+        Directory to write the csv files to. Default current directory
+    freq : str
+        Period of the partitions in UTC (e.g., 'M' for months). Default 'M'
+    chunksize : int
+        Number of export rows read at a time. Default 500000
+    max_workers : int, optional
+        Maximum number of worker processes. Default one per CPU
+
+    Returns
+    -------
+    lags : DataFrame
+        See create_upstream_lag_features
+    '''
+    sites = list(sites or STATIONS)
+    with tempfile.TemporaryDirectory() as work_dir, \
+         ProcessPoolExecutor(max_workers=max_workers) as executor:
+        partitions = partition_export(path, work_dir, sites, freq, chunksize)
+        records = pd.concat(executor.map(read_hourly_records,
+                                         [partition_path for site_partitions in partitions.values()
+                                          for _, partition_path in site_partitions]),
+                            ignore_index=True)
+
+
+    return create_upstream_lag_features(records, output_dir, sites=sites)
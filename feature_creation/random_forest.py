@@ -1,69 +1,382 @@
 import numpy as np
+import os
 import pandas as pd
+import warnings
+from contextlib import ExitStack
+from functools import partial
+from tempfile import TemporaryDirectory
 from typing import Union
 from sklearn.impute import SimpleImputer
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.pipeline import Pipeline
 from sklearn.model_selection import GridSearchCV
 from sklearn.metrics import mean_squared_error
-from .feature_selection import get_rf_feature_selection_pipeline, get_rf_feature_selection_grid
+from feature_selection import get_rf_feature_selection_pipeline, get_rf_feature_selection_grid # type: ignore
+from time_series_validation import EmbargoedTimeSeriesSplit
+from resumable_search import ResumableGridSearchCV
+from gradient_boosting import get_hgb_pipeline, get_hgb_grid
 
-def train_rf_model(X_train:Union[np.ndarray, pd.DataFrame], y_train, 
-                   externally_selected_features:Union[None, list]=None, 
-                   time_based_weights:Union[None, bool]=None) -> GridSearchCV:
+def train_rf_model(X_train: Union[np.ndarray, pd.DataFrame], y_train,
+                   externally_selected_features: Union[None, list] = None,
+                   time_based_weights: Union[None, bool] = None,
+                   grow_trees: bool = False, evaluation: str = 'cv',
+                   timestamps: Union[None, np.ndarray, pd.Series] = None,
+                   cache_dir: Union[None, str] = None,
+                   shared_memory: bool = False,
+                   search_cache_dir: Union[None, str] = None,
+                   engine: str = 'random_forest') -> GridSearchCV:
     """
-    Trains a random forest model using the given training data and hyperparameters.
+    Trains a random forest model (or another engine, see engine) using the given training data and hyperparameters.
 
     Args:
         X_train (numpy.ndarray): The training data features.
-        y_train (numpy.ndarray): The training data labels.
-        externally_selected_features (list, optional): A list of feature names to use for training. Defaults to None.
+        y_train (numpy.ndarray): The training data labels. A 2D array or DataFrame with several columns trains
+            one multi-output forest on all targets at once, sharing the preprocessing and folds; the search is
+            then ranked by the mean score over targets and the score of each target is reported in target_scores_.
+        externally_selected_features (list, optional): A list of feature names to use for training, or a mapping from
+            prune_correlated_features whose kept features are used; the pipeline's correlation filter is then skipped.
+            X_train must then be a DataFrame. Defaults to None.
         time_based_weights (numpy.ndarray, optional): A 1D array of weights to apply to each sample in X_train. Defaults to None.
+        grow_trees (bool, optional): If True, the grid search is run with a small forest and the best pipeline is then
+            grown in warm-start batches until its out-of-bag error plateaus. The chosen tree count is reported in
+            best_params_, the error at each size in n_estimators_history_ and the out-of-bag mean squared error of
+            the chosen forest in oob_mse_. best_score_, cv_results_ and target_scores_ still describe the forests of
+            the search, with search_n_estimators trees (see get_rf_growth_settings). Defaults to False.
+        evaluation (str, optional): How each configuration is scored. 'cv' uses 5-fold cross-validation,
+            'time' uses time-ordered folds with an embargo of the feature lookback (see EmbargoedTimeSeriesSplit)
+            and 'oob' scores a single fit on the full training set by its out-of-bag error. Defaults to 'cv'.
+        timestamps (numpy.ndarray, optional): The timestamp of each row of X_train, required by 'time'
+            evaluation unless X_train has a DatetimeIndex. Defaults to None.
+        cache_dir (str, optional): A directory where the fitted preprocessing steps of each fold are cached so
+            they are computed once and reused across the grid. If None, a temporary directory is used for the
+            duration of the search. Defaults to None.
+        shared_memory (bool, optional): If True, X_train is converted once to a float32, C-contiguous array that is
+            memory-mapped from a temporary file, so every parallel worker attaches to the same pages instead of
+            receiving its own pickled copy and every forest fit skips its own conversion. The fitted pipeline then
+            expects arrays, with columns in the order listed in feature_names_. Defaults to False.
+        search_cache_dir (str, optional): A directory where the per-fold scores and fit times of every evaluated
+            configuration are stored. If given, the search resumes from it and skips configurations already evaluated
+            on the same data, pipeline and folds (see ResumableGridSearchCV). Defaults to None.
+        engine (str, optional): The model to train, 'random_forest' (get_rf_pipeline and get_rf_grid) or
+            'hist_gradient_boosting' (get_hgb_pipeline and get_hgb_grid), which handles missing values natively and
+            picks its number of iterations by early stopping. grow_trees and 'oob' evaluation only apply to the random
+            forest. Defaults to 'random_forest'.
 
     Returns:
         sklearn.model_selection.GridSearchCV: A trained random forest model.
     """
-    
-    pipeline = get_rf_pipeline()
-    grid = get_rf_grid()
+    multi_target = np.ndim(y_train) == 2 and np.shape(y_train)[1] > 1
+
+    if externally_selected_features is not None:
+        if not isinstance(X_train, pd.DataFrame):
+            raise ValueError('externally_selected_features requires X_train to be a DataFrame')
+        X_train = X_train[list(externally_selected_features)]
 
-    grid = GridSearchCV(pipeline, n_jobs=-1, param_grid=grid, 
-                        scoring='neg_mean_squared_error', cv=5, verbose=1, 
-                        refit=True)
-    if time_based_weights is not False:
-        grid.fit(X_train, y_train, estimator__sample_weight=time_based_weights)
+    if engine == 'random_forest':
+        grid = get_rf_grid(n_features=np.shape(X_train)[1])
+    elif engine == 'hist_gradient_boosting':
+        if grow_trees or evaluation == 'oob':
+            raise ValueError("grow_trees and 'oob' evaluation are only available for the random forest engine")
+        grid = get_hgb_grid(multi_target=multi_target)
     else:
-        grid.fit(X_train, y_train)
+        raise ValueError(f"Unknown engine '{engine}', expected 'random_forest' or 'hist_gradient_boosting'")
+
+    if grow_trees:
+        growth_settings = get_rf_growth_settings()
+        grid['estimator__n_estimators'] = [growth_settings['search_n_estimators']]
+
+    with ExitStack() as stack:
+        if cache_dir is None:
+            memory = stack.enter_context(TemporaryDirectory())
+        else:
+            memory = cache_dir
+        if engine == 'random_forest':
+            pipeline = get_rf_pipeline(memory=memory)
+            if isinstance(externally_selected_features, dict):
+                # The pruning mapping already removed correlated features at the same threshold
+                pipeline.set_params(correlation='passthrough')
+        else:
+            pipeline = get_hgb_pipeline(memory=memory, multi_target=multi_target)
+
+        feature_names = list(X_train.columns) if isinstance(X_train, pd.DataFrame) else None
+        if shared_memory:
+            X_train = to_shared_matrix(X_train, stack.enter_context(TemporaryDirectory()))
+
+        if evaluation == 'cv':
+            scoring, cv = 'neg_mean_squared_error', 5
+        elif evaluation == 'time':
+            scoring, cv = 'neg_mean_squared_error', EmbargoedTimeSeriesSplit(n_splits=5, timestamps=timestamps)
+        elif evaluation == 'oob':
+            # Train and score on the same rows; the scorer only looks at out-of-bag predictions
+            pipeline.set_params(estimator__oob_score=True, estimator__bootstrap=True)
+            all_rows = np.arange(len(y_train))
+            scoring, cv = oob_neg_mean_squared_error, [(all_rows, all_rows)]
+        else:
+            raise ValueError(f"Unknown evaluation '{evaluation}', expected 'cv', 'time' or 'oob'")
+
+        if multi_target:
+            scoring = partial(multi_target_neg_mean_squared_error, oob=evaluation == 'oob')
+
+        if search_cache_dir is None:
+            grid = GridSearchCV(pipeline, n_jobs=-1, param_grid=grid,
+                                scoring=scoring, cv=cv, verbose=1,
+                                refit='mean' if multi_target else True)
+        else:
+            grid = ResumableGridSearchCV(pipeline, n_jobs=-1, param_grid=grid,
+                                         cache_dir=search_cache_dir,
+                                         scoring=scoring, cv=cv, verbose=1,
+                                         refit='mean' if multi_target else True)
+        if time_based_weights is not False:
+            grid.fit(X_train, y_train, estimator__sample_weight=time_based_weights)
+        else:
+            grid.fit(X_train, y_train)
+
+        if grow_trees:
+            sample_weight = time_based_weights if time_based_weights is not False else None
+            history = grow_rf_estimator(grid.best_estimator_, X_train, y_train,
+                                        sample_weight=sample_weight,
+                                        step=growth_settings['step'],
+                                        max_estimators=growth_settings['max_estimators'],
+                                        tol=growth_settings['tol'],
+                                        patience=growth_settings['patience'])
+            n_estimators = grid.best_estimator_.named_steps['estimator'].n_estimators
+            grid.best_params_ = {**grid.best_params_, 'estimator__n_estimators': n_estimators}
+            grid.n_estimators_history_ = history
+            # best_score_ and cv_results_ still describe the search-size forest; this is the grown one's error
+            grid.oob_mse_ = history.loc[history['n_estimators'] == n_estimators, 'oob_mse'].iloc[-1]
+
+    if cache_dir is None:
+        # The temporary cache is gone, so refits of the best pipeline must not look for it
+        grid.best_estimator_.set_params(memory=None)
+        if 'selector' in grid.best_estimator_.named_steps:
+            grid.best_estimator_.set_params(selector__memory=None)
+
+    grid.feature_names_ = feature_names
+
+    if multi_target:
+        grid.target_scores_ = pd.Series({
+            name: grid.cv_results_[f'mean_test_{name}'][grid.best_index_]
+            for name in get_target_names(y_train)
+        })
 
     return grid
 
-def get_rf_pipeline() -> Pipeline:
+def grow_rf_estimator(pipeline: Pipeline, X_train: Union[np.ndarray, pd.DataFrame], y_train,
+                      sample_weight: Union[None, np.ndarray] = None, step: int = 25,
+                      max_estimators: int = 500, tol: float = 1e-3,
+                      patience: int = 2) -> pd.DataFrame:
+    """
+    Grows the forest of a random forest pipeline in warm-start batches of trees, recording the
+    out-of-bag error at each size and stopping once it plateaus. The preprocessing steps are only
+    fitted once and the forest is trimmed back to the size with the lowest error.
+
+    Args:
+        pipeline (sklearn.pipeline.Pipeline): A pipeline from get_rf_pipeline, fitted or not. If its
+            forest is already fitted, growth continues from the existing trees.
+        X_train (numpy.ndarray): The training data features.
+        y_train (numpy.ndarray): The training data labels.
+        sample_weight (numpy.ndarray, optional): A 1D array of weights to apply to each sample in X_train. Defaults to None.
+        step (int, optional): The number of trees added per batch. Defaults to 25.
+        max_estimators (int, optional): The largest forest to grow. Defaults to 500.
+        tol (float, optional): The relative out-of-bag error improvement below which a batch counts
+            as no improvement. Defaults to 1e-3.
+        patience (int, optional): The number of batches without improvement before growth stops. Defaults to 2.
+
+    Returns:
+        pandas.DataFrame: The out-of-bag mean squared error of the existing forest, if any, and of every forest
+            size that was grown.
+    """
+    estimator = pipeline.named_steps['estimator']
+    preprocessing = pipeline[:-1]
+    if hasattr(estimator, 'estimators_'):
+        X_transformed = preprocessing.transform(X_train)
+        n_estimators = len(estimator.estimators_)
+    else:
+        X_transformed = preprocessing.fit_transform(X_train, y_train)
+        n_estimators = 0
+
+    estimator.set_params(warm_start=True, oob_score=True, bootstrap=True)
+
+    # Score the existing forest first, so growth only wins if it beats it
+    history = []
+    best_error, best_n_estimators, stale_batches = np.inf, n_estimators, 0
+    if n_estimators:
+        best_error = refresh_oob_prediction(estimator, X_transformed, y_train, sample_weight)
+        history.append({'n_estimators': n_estimators, 'oob_mse': best_error})
+
+    while n_estimators < max_estimators and stale_batches < patience:
+        n_estimators = min(n_estimators + step, max_estimators)
+        estimator.set_params(n_estimators=n_estimators)
+        estimator.fit(X_transformed, y_train, sample_weight=sample_weight)
+
+        oob_error = mean_squared_error(y_train, estimator.oob_prediction_)
+        history.append({'n_estimators': n_estimators, 'oob_mse': oob_error})
+
+        if oob_error < best_error * (1 - tol):
+            stale_batches = 0
+        else:
+            stale_batches += 1
+        if oob_error < best_error:
+            best_error, best_n_estimators = oob_error, n_estimators
+
+    # Trees are only ever appended, so the best forest is a prefix of the grown one. The
+    # out-of-bag attributes are recomputed so they describe the trimmed forest
+    if best_n_estimators < len(estimator.estimators_):
+        estimator.estimators_ = estimator.estimators_[:best_n_estimators]
+        refresh_oob_prediction(estimator, X_transformed, y_train, sample_weight)
+    estimator.set_params(n_estimators=best_n_estimators, warm_start=False)
+
+    return pd.DataFrame(history)
+
+def refresh_oob_prediction(estimator: RandomForestRegressor, X_transformed, y_train,
+                           sample_weight: Union[None, np.ndarray] = None) -> float:
+    """
+    Recomputes oob_prediction_ and oob_score_ of a fitted bootstrap forest for its current trees,
+    e.g. after trees were removed or if it was fitted without oob_score.
+
+    Args:
+        estimator (sklearn.ensemble.RandomForestRegressor): A fitted forest with bootstrap=True.
+        X_transformed (numpy.ndarray): The features the forest was fitted on.
+        y_train (numpy.ndarray): The labels the forest was fitted on.
+        sample_weight (numpy.ndarray, optional): The sample weights the forest was fitted with. The bootstrap
+            samples are drawn from them, so they are needed to tell in-bag from out-of-bag rows. Defaults to None.
+
+    Returns:
+        float: The out-of-bag mean squared error.
+    """
+    for attribute in ('oob_score_', 'oob_prediction_'):
+        if hasattr(estimator, attribute):
+            delattr(estimator, attribute)
+
+    # A warm-start fit without new trees only computes the out-of-bag predictions
+    warm_start, n_estimators = estimator.warm_start, estimator.n_estimators
+    estimator.set_params(warm_start=True, oob_score=True, n_estimators=len(estimator.estimators_))
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='Warm-start fitting without increasing n_estimators')
+        estimator.fit(X_transformed, y_train, sample_weight=sample_weight)
+    estimator.set_params(warm_start=warm_start, n_estimators=n_estimators)
+
+    return mean_squared_error(y_train, estimator.oob_prediction_)
+
+def oob_neg_mean_squared_error(pipeline: Pipeline, X, y) -> float:
+    """
+    Scores a fitted random forest pipeline by the negative mean squared error of its out-of-bag
+    predictions. Can be used as a GridSearchCV scorer when every split trains and tests on the
+    same rows.
+
+    Args:
+        pipeline (sklearn.pipeline.Pipeline): A pipeline whose forest was fitted with oob_score=True.
+        X (numpy.ndarray): The features the pipeline was fitted on (unused).
+        y (numpy.ndarray): The labels the pipeline was fitted on.
+
+    Returns:
+        float: The negative out-of-bag mean squared error.
+    """
+    oob_prediction = pipeline.named_steps['estimator'].oob_prediction_
+
+    return -mean_squared_error(y, oob_prediction)
+
+def multi_target_neg_mean_squared_error(pipeline: Pipeline, X, y, oob: bool = False) -> dict:
+    """
+    Scores a fitted multi-output pipeline by the negative mean squared error of every target in a
+    single prediction pass, so it can be used as a multi-metric GridSearchCV scorer.
+
+    Args:
+        pipeline (sklearn.pipeline.Pipeline): A fitted multi-output pipeline.
+        X (numpy.ndarray): The test data features.
+        y (numpy.ndarray): The test data labels, one column per target.
+        oob (bool, optional): If True, score the out-of-bag predictions of the forest instead of
+            predicting X (see oob_neg_mean_squared_error). Defaults to False.
+
+    Returns:
+        dict: The negative mean squared error of each target, keyed by target name, and their mean under 'mean'.
+    """
+    if oob:
+        prediction = pipeline.named_steps['estimator'].oob_prediction_
+    else:
+        prediction = pipeline.predict(X)
+    errors = mean_squared_error(y, prediction, multioutput='raw_values')
+
+    scores = {'mean': -errors.mean()}
+    scores.update({name: -error for name, error in zip(get_target_names(y), errors)})
+
+    return scores
+
+def get_target_names(y) -> list:
+    """
+    Returns the names of the targets in a 2D label array.
+
+    Args:
+        y (numpy.ndarray): The labels, one column per target.
+
+    Returns:
+        list: The DataFrame column names of y, or 'target_<i>' for arrays.
+    """
+    if isinstance(y, pd.DataFrame):
+        return [str(column) for column in y.columns]
+
+    return [f'target_{i}' for i in range(np.shape(y)[1])]
+
+def to_shared_matrix(X: Union[np.ndarray, pd.DataFrame], folder: str) -> np.memmap:
+    """
+    Converts X once to a float32, C-contiguous array backed by a file in folder and returns it as a
+    read-only memory map. joblib passes memory maps to worker processes by file name, so all workers
+    share the same pages instead of each receiving a pickled copy.
+
+    Args:
+        X (numpy.ndarray): The training data features.
+        folder (str): The directory the array is written to. It must outlive every use of the array.
+
+    Returns:
+        numpy.memmap: A read-only float32 view of X.
+    """
+    path = os.path.join(folder, 'X_train.npy')
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=np.shape(X))
+
+    # Fill column by column to avoid a full temporary copy of a DataFrame
+    if isinstance(X, pd.DataFrame):
+        for i, column in enumerate(X.columns):
+            matrix[:, i] = X[column].to_numpy(dtype=np.float32)
+    else:
+        matrix[:] = X
+    matrix.flush()
+    del matrix
+
+    return np.load(path, mmap_mode='r')
+
+def get_rf_pipeline(memory: Union[None, str] = None) -> Pipeline:
     """
     Returns a pipeline for training a random forest model.
 
+    Args:
+        memory (str, optional): A directory used to cache the fitted preprocessing steps and feature
+            rankings. Defaults to None.
+
     Returns:
         sklearn.pipeline.Pipeline: A pipeline for training a random forest model.
     """
     pipeline_steps = [('imputer', SimpleImputer())]
-    pipeline_steps.extend(get_rf_feature_selection_pipeline())
+    pipeline_steps.extend(get_rf_feature_selection_pipeline(memory=memory))
     pipeline_steps.append(
         ('estimator', RandomForestRegressor())
     )
 
-    print(pipeline_steps)
-
-    return Pipeline(pipeline_steps)
+    return Pipeline(pipeline_steps, memory=memory)
 
-def get_rf_grid() -> dict:
+def get_rf_grid(n_features: Union[None, int] = None) -> dict:
     """
     Returns a dictionary of hyperparameters to use for training a random forest model that
     is used in a grid search.
 
+    Args:
+        n_features (int, optional): The number of input features (see get_rf_feature_selection_grid).
+            Defaults to None.
+
     Returns:
         dict: A dictionary of hyperparameters to use for training a random forest model.
     """
     rf_grid = {}
-    rf_grid.update(get_rf_feature_selection_grid())
+    rf_grid.update(get_rf_feature_selection_grid(n_features=n_features))
     rf_grid.update(get_rf_model_grid())
 
     return rf_grid
@@ -76,14 +389,26 @@ def get_rf_model_grid() -> dict:
     Returns:
         dict: A dictionary of hyperparameters to use for training a random forest model.
     """
-
     return {
         'estimator__n_estimators': [200],
         'estimator__max_depth': [None, 10, 20],
         'estimator__max_features': [None, 'sqrt', 'log2'],
-        'estimator__max_depth': [10, 20],
-        'estimator__max_features': ['sqrt', 'log2'],
         'estimator__min_samples_split': [5, 10],
         'estimator__min_samples_leaf': [1, 2, 4],
-        # 'model__bootstrap': [True, False]
+    }
+
+def get_rf_growth_settings() -> dict:
+    """
+    Returns the settings used when growing the forest with warm starts instead of searching
+    over n_estimators.
+
+    Returns:
+        dict: The forest size used during the grid search and the growth schedule for the best pipeline.
+    """
+    return {
+        'search_n_estimators': 50,
+        'step': 25,
+        'max_estimators': 500,
+        'tol': 1e-3,
+        'patience': 2,
     }
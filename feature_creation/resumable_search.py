@@ -0,0 +1,182 @@
+import json
+import os
+import time
+import numpy as np
+from typing import Union
+from joblib import Parallel, delayed, hash as joblib_hash
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import GridSearchCV, ParameterGrid, check_cv, cross_validate
+from sklearn.pipeline import Pipeline
+from scipy.stats import rankdata
+
+class ResumableGridSearchCV(GridSearchCV):
+    """
+    Grid search that stores the per-fold scores and fit times of every evaluated configuration in
+    a persistent cache and skips configurations that were already evaluated.
+
+    A configuration's cache key combines a fingerprint of the training data, the pipeline definition
+    (steps and parameters, ignoring cache locations), the scoring, the fold row indices and the
+    parameter set. An interrupted search therefore resumes where it stopped, and extending the grid
+    only fits the new configurations. The results of cached and new configurations are reported
+    together through the usual GridSearchCV attributes, and cv_results_['cached'] marks which ones
+    came from the cache.
+
+    Args:
+        estimator (sklearn.pipeline.Pipeline): The pipeline to tune.
+        param_grid (dict): The hyperparameter grid.
+        cache_dir (str): The directory holding the cached results, one JSON file per configuration.
+        scoring (str or callable, optional): The scoring, as for GridSearchCV. A callable may return a
+            dict of scores. Defaults to None.
+        n_jobs (int, optional): The number of configurations evaluated in parallel. Defaults to None.
+        refit (bool or str, optional): Whether to refit the best configuration on the whole training set,
+            or the score name to rank by for multi-metric scoring. Defaults to True.
+        cv (int or cross-validator, optional): The cross-validation splits, as for GridSearchCV. Defaults to None.
+        verbose (int, optional): The verbosity level. Defaults to 0.
+        error_score (float, optional): The score assigned to failed fits. Defaults to numpy.nan.
+    """
+
+    def __init__(self, estimator, param_grid, *, cache_dir: str, scoring=None, n_jobs=None,
+                 refit=True, cv=None, verbose=0, error_score=np.nan):
+        super().__init__(estimator, param_grid, scoring=scoring, n_jobs=n_jobs, refit=refit,
+                         cv=cv, verbose=verbose, error_score=error_score)
+        self.cache_dir = cache_dir
+
+    def fit(self, X, y=None, **fit_params):
+        """
+        Evaluates every configuration that is not cached yet, then ranks all of them and refits the best.
+
+        Args:
+            X (numpy.ndarray): The training data features.
+            y (numpy.ndarray, optional): The training data labels.
+            **fit_params: Parameters passed to the fit method of the pipeline.
+
+        Returns:
+            ResumableGridSearchCV: The fitted search.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        candidates = list(ParameterGrid(self.param_grid))
+        splits = list(check_cv(self.cv, y, classifier=False).split(X, y))
+        search_key = joblib_hash((joblib_hash((X, y, fit_params)),
+                                  get_pipeline_definition(self.estimator),
+                                  self.scoring, splits))
+        keys = [joblib_hash((search_key, sorted(params.items(), key=str))) for params in candidates]
+
+        results = [self._load_result(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if self.verbose > 0:
+            print(f'Fitting {len(splits)} folds for each of {len(missing)} uncached candidates, '
+                  f'{len(candidates) - len(missing)} candidates loaded from cache')
+
+        new_results = Parallel(n_jobs=self.n_jobs, verbose=self.verbose)(
+            delayed(_evaluate_candidate)(self.estimator, candidates[i], X, y, splits,
+                                         self.scoring, fit_params, self.error_score,
+                                         self._get_result_path(keys[i]))
+            for i in missing
+        )
+        for i, result in zip(missing, new_results):
+            results[i] = result
+
+        self.cv_results_ = _format_results(candidates, results, missing)
+        self.n_splits_ = len(splits)
+        self.multimetric_ = list(results[0]['test_scores']) != ['score']
+
+        refit_metric = self.refit if isinstance(self.refit, str) else 'score'
+        if self.refit is not False:
+            self.best_index_ = int(np.argmin(self.cv_results_[f'rank_test_{refit_metric}']))
+            self.best_score_ = self.cv_results_[f'mean_test_{refit_metric}'][self.best_index_]
+            self.best_params_ = candidates[self.best_index_]
+
+            refit_start = time.time()
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y, **fit_params)
+            self.refit_time_ = time.time() - refit_start
+
+        self.scorer_ = check_scoring(self.estimator, self.scoring)
+
+        return self
+
+    def _get_result_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def _load_result(self, key: str) -> Union[None, dict]:
+        path = self._get_result_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return json.load(file)
+
+
+def get_pipeline_definition(pipeline: Pipeline) -> list:
+    """
+    Returns a hashable description of a pipeline: the class of every step and every plain
+    parameter value, leaving out cache locations that change between runs.
+
+    Args:
+        pipeline (sklearn.pipeline.Pipeline): The pipeline to describe.
+
+    Returns:
+        list: Sorted (name, value) pairs describing the pipeline.
+    """
+    definition = [(name, f'{type(step).__module__}.{type(step).__qualname__}')
+                  for name, step in pipeline.steps]
+    definition.extend(
+        (name, value) for name, value in pipeline.get_params(deep=True).items()
+        if name != 'steps' and name.split('__')[-1] != 'memory' and not hasattr(value, 'get_params')
+    )
+
+    return sorted(definition, key=str)
+
+
+def _evaluate_candidate(estimator, params: dict, X, y, splits: list, scoring, fit_params: dict,
+                        error_score, result_path: str) -> dict:
+    cv_result = cross_validate(clone(estimator).set_params(**params), X, y, cv=splits,
+                               scoring=scoring, params=fit_params, error_score=error_score)
+    result = {
+        'params': params,
+        'test_scores': {name[len('test_'):]: cv_result[name].tolist()
+                        for name in cv_result if name.startswith('test_')},
+        'fit_time': cv_result['fit_time'].tolist(),
+        'score_time': cv_result['score_time'].tolist(),
+    }
+
+    # Write to a temporary file first so an interrupted search never leaves a partial result
+    with open(result_path + '.tmp', 'w') as file:
+        json.dump(result, file)
+    os.replace(result_path + '.tmp', result_path)
+
+    return result
+
+
+def _format_results(candidates: list, results: list, missing: list) -> dict:
+    missing = set(missing)
+    cv_results = {
+        'mean_fit_time': np.array([np.mean(result['fit_time']) for result in results]),
+        'std_fit_time': np.array([np.std(result['fit_time']) for result in results]),
+        'mean_score_time': np.array([np.mean(result['score_time']) for result in results]),
+        'std_score_time': np.array([np.std(result['score_time']) for result in results]),
+    }
+    for name in sorted({name for params in candidates for name in params}):
+        cv_results[f'param_{name}'] = np.ma.MaskedArray(
+            [params.get(name) for params in candidates],
+            mask=[name not in params for params in candidates],
+            dtype=object
+        )
+    cv_results['params'] = candidates
+
+    for metric in results[0]['test_scores']:
+        split_scores = np.array([result['test_scores'][metric] for result in results], dtype=float)
+        for split in range(split_scores.shape[1]):
+            cv_results[f'split{split}_test_{metric}'] = split_scores[:, split]
+        mean_scores = split_scores.mean(axis=1)
+        cv_results[f'mean_test_{metric}'] = mean_scores
+        cv_results[f'std_test_{metric}'] = split_scores.std(axis=1)
+        # Failed configurations rank last, as in GridSearchCV
+        cv_results[f'rank_test_{metric}'] = rankdata(
+            -np.nan_to_num(mean_scores, nan=-np.inf), method='min'
+        ).astype(np.int32)
+
+    cv_results['cached'] = np.array([i not in missing for i in range(len(candidates))])
+
+    return cv_results
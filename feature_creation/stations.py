@@ -0,0 +1,276 @@
+"""
+CODE PURPOSE: Registry of AquaHive stations and parameters that drives feature
+              creation, merging and model input selection, and per-station
+              parallel feature creation
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from feature_creation_adaptive_monitoring import calc_discharge_site_features_hrs_ago, calc_param_site_features_hrs_ago, calc_loads
+
+#==================================Registry====================================
+
+# AquaHive stations and the parameters to create features for at each.
+    # Add a station here to include it in feature creation, merging and
+    # model inputs. downstream is the station the river flows to next
+    # (used for travel-time lag features, see lag_discovery.py)
+STATIONS = {
+    'pnwa': {'name': 'Pinawa', 'parameters': ['turbidity', 'toc']},
+    'wmth': {'name': 'Whitemouth', 'parameters': ['turbidity', 'toc'],
+             'downstream': 'pnwa'},
+}
+
+# Parameters and the prefix of their feature files
+    # (total dissolved solids aren't needed for now, add to a station to use)
+PARAMETERS = {
+    'turbidity': {'file_prefix': 'tur'},
+    'toc': {'file_prefix': 'toc'},
+    'total_dissolved_solids': {'file_prefix': 'tds'},
+}
+
+# Hours-ago buckets, (hours_ago_start, hours_ago_end)
+HOUR_BUCKETS = [(1, 3), (4, 6), (7, 9), (10, 12), (13, 15)]
+
+# Longest lookback of the buckets, e.g. the embargo of time-ordered folds
+    # (see time_series_validation.py) and the halo of partitions
+FEATURE_LOOKBACK_HOURS = max(end for _, end in HOUR_BUCKETS)
+
+
+#==============================Registry lookups================================
+
+def get_param_feature_files(param: str, sites=None):
+    '''
+    Return the concentration and load feature file names of parameter param
+    for every station that measures it
+
+    Parameters
+    ----------
+    param : str
+        The parameter (e.g., 'toc' for total organic carbon)
+    sites : list, optional
+        The stations to include. Default all registered stations
+
+    Returns
+    -------
+    files : list
+        Feature file names, concentration then load for each station
+    '''
+    prefix = PARAMETERS[param]['file_prefix']
+    files = []
+    for site in sites or STATIONS:
+        if param in STATIONS[site]['parameters']:
+            files.append(prefix+'_'+site+'_concentration_features.csv')
+            files.append(prefix+'_'+site+'_load_features.csv')
+
+
+    return files
+
+
+def get_discharge_feature_files(sites=None):
+    '''
+    Return the discharge feature file names of every station
+
+    Parameters
+    ----------
+    sites : list, optional
+        The stations to include. Default all registered stations
+
+    Returns
+    -------
+    files : list
+        Discharge feature file names
+    '''
+    return ['discharge_'+site+'_features.csv' for site in sites or STATIONS]
+
+
+def get_lag_feature_files(param: str, sites=None):
+    '''
+    Return the upstream lag feature file names of parameter param for every
+    station whose downstream station is also included (see
+    create_upstream_lag_features in lag_discovery.py)
+
+    Parameters
+    ----------
+    param : str
+        The parameter (e.g., 'toc' for total organic carbon), or 'discharge'
+    sites : list, optional
+        The stations to include. Default all registered stations
+
+    Returns
+    -------
+    files : list
+        Lag feature file names, concentration then load for each pair
+        (one file per pair for discharge)
+    '''
+    sites = list(sites or STATIONS)
+    files = []
+    for upstream_site in sites:
+        downstream_site = STATIONS[upstream_site].get('downstream')
+        if downstream_site not in sites:
+            continue
+        if param == 'discharge':
+            files.append('discharge_'+upstream_site+'_'+downstream_site+'_lag_features.csv')
+        elif (param in STATIONS[upstream_site]['parameters'] and
+              param in STATIONS[downstream_site]['parameters']):
+            prefix = PARAMETERS[param]['file_prefix']+'_'+upstream_site+'_'+downstream_site
+            files.append(prefix+'_lag_concentration_features.csv')
+            files.append(prefix+'_lag_load_features.csv')
+
+
+    return files
+
+
+def get_station_columns(columns, sites=None):
+    '''
+    Return the feature columns that belong to registered stations
+
+    Parameters
+    ----------
+    columns : list
+        Column names of a combined feature table
+    sites : list, optional
+        The stations to include. Default all registered stations
+
+    Returns
+    -------
+    station_columns : list
+        Columns whose name contains a station code, in their original order
+    '''
+    sites = list(sites or STATIONS)
+
+
+    return [col for col in columns if any(site in col for site in sites)]
+
+
+#===========================Station feature creation===========================
+
+def calc_station_features(df, site: str, regular_grid: bool = False):
+    '''
+    Return all feature tables of station site: concentration and load
+    features of each of its parameters and its discharge features, with
+    every hours-ago bucket side by side. Loads of all parameters are added to
+    df in one pass (see calc_loads) unless it already has a load column
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset (may be pre-filtered to site)
+    site : str
+        The station (e.g., 'pnwa' for Pinawa)
+    regular_grid : bool
+        Passed to the feature functions (see resample_hourly). Default False
+
+    Returns
+    -------
+    tables : dict
+        Feature tables indexed by timestamp_ccentral, keyed by file name
+    '''
+    if 'load' not in df.columns:
+        calc_loads(df)
+
+
+    tables = {}
+    for param in STATIONS[site]['parameters']:
+        bucket_features = [calc_param_site_features_hrs_ago(df=df,
+                                                            param=param,
+                                                            site=site,
+                                                            hours_ago_start=start,
+                                                            hours_ago_end=end,
+                                                            regular_grid=regular_grid)
+                           for start, end in HOUR_BUCKETS]
+
+
+        # Create final concentration and load feature tables
+        conc_file, load_file = get_param_feature_files(param, sites=[site])
+        tables[conc_file] = pd.concat([features[0].set_index('timestamp_ccentral')
+                                       for features in bucket_features],
+                                      axis=1)
+        tables[load_file] = pd.concat([features[1].set_index('timestamp_ccentral')
+                                       for features in bucket_features],
+                                      axis=1)
+
+
+    # Create final discharge feature table
+    discharge_file, = get_discharge_feature_files(sites=[site])
+    tables[discharge_file] = pd.concat(
+        [calc_discharge_site_features_hrs_ago(df=df,
+                                              site=site,
+                                              hours_ago_start=start,
+                                              hours_ago_end=end,
+                                              regular_grid=regular_grid).set_index('timestamp_ccentral')
+         for start, end in HOUR_BUCKETS],
+        axis=1)
+
+
+    return tables
+
+
+def export_station_features(df, site: str, output_dir: str = '.',
+                            regular_grid: bool = False):
+    '''
+    Create all feature tables of station site and export them as csv
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset (may be pre-filtered to site)
+    site : str
+        The station (e.g., 'pnwa' for Pinawa)
+    output_dir : str
+        Directory to write the csv files to. Default current directory
+    regular_grid : bool
+        Passed to the feature functions (see resample_hourly). Default False
+
+    Returns
+    -------
+    files : list
+        Paths of the exported csv files
+    '''
+    files = []
+    for file_name, table in calc_station_features(df, site, regular_grid).items():
+        path = os.path.join(output_dir, file_name)
+        table.to_csv(path, index=True)
+        files.append(path)
+
+
+    return files
+
+
+def create_all_station_features(df, sites=None, output_dir: str = '.',
+                                regular_grid: bool = False, max_workers=None):
+    '''
+    Create and export the feature tables of every station, one worker
+    process per station. The dataset is partitioned by station once, so each
+    worker only receives and copies its own station's records
+
+    Parameters
+    ----------
+    df : DataFrame
+        AquaHive dataset
+    sites : list, optional
+        The stations to process. Default all registered stations
+    output_dir : str
+        Directory to write the csv files to. Default current directory
+    regular_grid : bool
+        Passed to the feature functions (see resample_hourly). Default False
+    max_workers : int, optional
+        Maximum number of worker processes. Default one per CPU
+
+    Returns
+    -------
+    files : list
+        Paths of the exported csv files
+    '''
+    sites = list(sites or STATIONS)
+    partitions = dict(tuple(df[df['site'].isin(sites)].groupby('site')))
+
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(export_station_features, partitions[site],
+                                   site, output_dir, regular_grid)
+                   for site in sites if site in partitions]
+        files = [file for future in futures for file in future.result()]
+
+
+    return files
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from random_forest import get_rf_pipeline
+from inference import export_rf_artifact, CompiledForest
+
+def test_compiled_forest_matches_pipeline(tmp_path):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(300, 8)), columns=[f'feature_{i}' for i in range(8)])
+    X['constant'] = 1.0
+    X['empty'] = np.nan
+    X = X.mask(rng.random(X.shape) < 0.1)
+    y = np.column_stack([X['feature_0'].fillna(0) * 2, X['feature_1'].fillna(0) - X['feature_2'].fillna(0)])
+
+    pipeline = get_rf_pipeline()
+    pipeline.set_params(selector__k=5, estimator__n_estimators=20, estimator__random_state=0)
+    pipeline.fit(X, y)
+
+    path = tmp_path / 'forest.npz'
+    export_rf_artifact(pipeline, path, feature_names=list(X.columns))
+    compiled = CompiledForest(path, batch_size=64)
+
+    # The imputer drops the empty column and the variance step the constant one
+    assert len(compiled.columns) == 5
+
+    # Columns are selected by name, whatever their order in the DataFrame
+    X_new = pd.DataFrame(rng.normal(size=(200, 10)), columns=X.columns).mask(rng.random((200, 10)) < 0.2)
+    expected = pipeline.predict(X_new)
+    np.testing.assert_allclose(compiled.predict(X_new[X.columns[::-1]]), expected, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(compiled.predict(X_new.to_numpy()), expected, rtol=1e-12, atol=1e-12)
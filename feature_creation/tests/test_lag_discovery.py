@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+from lag_discovery import calc_cross_correlation
+
+def test_cross_correlation_is_pearson_over_overlap():
+    # Downstream follows upstream 20 hours later, with a long gap and a high-variance stretch
+    rng = np.random.default_rng(0)
+    hours = pd.date_range('2022-06-01', periods=2000, freq='h', tz='Canada/Central')
+    upstream = pd.Series(rng.normal(size=2000).cumsum(), index=hours)
+    upstream.iloc[1200:1400] *= 5
+    downstream = upstream.shift(20) * 0.5 + rng.normal(scale=0.1, size=2000) + 3
+    downstream.iloc[300:900] = np.nan
+    upstream = upstream.mask(rng.random(2000) < 0.1)
+
+    correlation = calc_cross_correlation(upstream, downstream, max_lag_hours=48)
+
+    assert correlation.idxmax() == 20
+    for lag in [0, 20, 35]:
+        expected = upstream.reset_index(drop=True).corr(downstream.shift(-lag).reset_index(drop=True))
+        np.testing.assert_allclose(correlation[lag], expected, rtol=1e-9)
+    assert correlation.max() <= 1
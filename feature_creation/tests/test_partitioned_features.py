@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from stations import create_all_station_features
+from lag_discovery import create_upstream_lag_features
+from partitioned_features import create_all_station_features_partitioned, create_upstream_lag_features_partitioned
+
+def make_export(path, late_start=None):
+    # Irregular 20-minute records of every registered station and parameter, in shuffled export order
+    rng = np.random.default_rng(0)
+    records = []
+    for site in ['pnwa', 'wmth']:
+        times = pd.date_range('2022-10-25', '2022-11-20', freq='20min', tz='UTC')
+        times = times[rng.random(len(times)) > 0.2]
+        for param in ['turbidity', 'toc']:
+            records.append(pd.DataFrame({'timestamp': times.astype(str), 'site': site, 'parameter': param,
+                                         'value': rng.random(len(times)) * 10,
+                                         'discharge': 50 + np.sin(np.arange(len(times)) / 50) * 10}))
+    export = pd.concat(records, ignore_index=True).sample(frac=1, random_state=0)
+
+    # A sensor that starts reporting after the others
+    if late_start is not None:
+        site, param, start = late_start
+        export = export[~((export['site'] == site) & (export['parameter'] == param) &
+                          (pd.to_datetime(export['timestamp'], utc=True) < pd.Timestamp(start, tz='UTC')))]
+    export.to_csv(path, index=False)
+
+
+@pytest.mark.parametrize('late_start', [None, ('wmth', 'toc', '2022-11-08')])
+@pytest.mark.parametrize('regular_grid', [False, True])
+@pytest.mark.parametrize('freq', ['W', 'M'])
+def test_partitioned_matches_in_memory(tmp_path, late_start, regular_grid, freq):
+    export_path = tmp_path / 'aquahives_export.csv'
+    make_export(export_path, late_start)
+    (tmp_path / 'memory').mkdir()
+    (tmp_path / 'partitioned').mkdir()
+
+    expected_files = create_all_station_features(pd.read_csv(export_path), output_dir=str(tmp_path / 'memory'),
+                                                 regular_grid=regular_grid, max_workers=2)
+    files = create_all_station_features_partitioned(str(export_path), output_dir=str(tmp_path / 'partitioned'),
+                                                    regular_grid=regular_grid, freq=freq, max_workers=2)
+
+    assert sorted(map(os.path.basename, files)) == sorted(map(os.path.basename, expected_files))
+    for expected_file in expected_files:
+        expected = pd.read_csv(expected_file)
+        stitched = pd.read_csv(tmp_path / 'partitioned' / os.path.basename(expected_file))
+        pd.testing.assert_frame_equal(stitched, expected, check_exact=False, rtol=1e-9, atol=1e-9)
+
+
+def test_partitioned_lag_features_match_in_memory(tmp_path):
+    export_path = tmp_path / 'aquahives_export.csv'
+    make_export(export_path)
+    (tmp_path / 'memory').mkdir()
+    (tmp_path / 'partitioned').mkdir()
+
+    expected = create_upstream_lag_features(pd.read_csv(export_path), str(tmp_path / 'memory'))
+    lags = create_upstream_lag_features_partitioned(str(export_path), output_dir=str(tmp_path / 'partitioned'),
+                                                    freq='W', max_workers=2)
+
+    pd.testing.assert_frame_equal(lags.drop(columns='files'), expected.drop(columns='files'))
+    for files in expected['files']:
+        for expected_file in files.split(';'):
+            pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'partitioned' / os.path.basename(expected_file)),
+                                          pd.read_csv(expected_file), check_exact=False, rtol=1e-9, atol=1e-9)
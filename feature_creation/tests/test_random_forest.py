@@ -0,0 +1,22 @@
+import numpy as np
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestRegressor
+from random_forest import refresh_oob_prediction
+
+def test_refresh_oob_prediction_matches_fresh_weighted_forest():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 5))
+    y = X[:, 0] * 2 + rng.normal(size=300)
+    sample_weight = rng.exponential(size=300)
+
+    forest = RandomForestRegressor(n_estimators=50, oob_score=True, random_state=0)
+    fresh = clone(forest).fit(X, y, sample_weight=sample_weight)
+
+    # A larger forest trimmed back to the same trees must be scored like the fresh one
+    trimmed = clone(forest).set_params(n_estimators=100).fit(X, y, sample_weight=sample_weight)
+    trimmed.estimators_ = trimmed.estimators_[:50]
+    oob_error = refresh_oob_prediction(trimmed, X, y, sample_weight)
+
+    np.testing.assert_allclose(trimmed.oob_prediction_, fresh.oob_prediction_, rtol=1e-12)
+    np.testing.assert_allclose(oob_error, np.mean((y - fresh.oob_prediction_) ** 2), rtol=1e-12)
+    assert trimmed.oob_score_ == fresh.oob_score_
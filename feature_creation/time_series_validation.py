@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+from typing import Union
+from stations import FEATURE_LOOKBACK_HOURS
+
+class EmbargoedTimeSeriesSplit:
+    """
+    Time-ordered cross-validator with an embargo gap between the training and test rows.
+
+    Rows are ordered by timestamp and split into n_splits + 1 consecutive blocks. Each fold tests on
+    one block and trains on every earlier row whose timestamp is more than embargo_hours before
+    the start of the test block, so lagged features of the test rows never overlap the training rows.
+    Folds left without training rows by the embargo are skipped.
+
+    Args:
+        n_splits (int, optional): The number of folds. Defaults to 5.
+        embargo_hours (float, optional): The gap between the last training row and the first test row.
+            Defaults to FEATURE_LOOKBACK_HOURS.
+        timestamps (array-like, optional): The timestamp of each row of X. If None, X must be a
+            DataFrame with a DatetimeIndex. Defaults to None.
+    """
+
+    def __init__(self, n_splits: int = 5, embargo_hours: float = FEATURE_LOOKBACK_HOURS,
+                 timestamps: Union[None, np.ndarray, pd.Series] = None):
+        self.n_splits = n_splits
+        self.embargo_hours = embargo_hours
+        self.timestamps = timestamps
+
+    def get_n_splits(self, X=None, y=None, groups=None) -> int:
+        """
+        Returns the number of folds, not counting folds skipped by the embargo when X is given.
+
+        Returns:
+            int: The number of folds.
+        """
+        if X is None:
+            return self.n_splits
+
+        return sum(1 for _ in self.split(X, y, groups))
+
+    def split(self, X, y=None, groups=None):
+        """
+        Generates the training and test row indices of each fold.
+
+        Args:
+            X (numpy.ndarray): The training data features.
+            y (numpy.ndarray, optional): The training data labels (unused).
+            groups (numpy.ndarray, optional): Unused.
+
+        Yields:
+            tuple: The training row indices and test row indices of a fold.
+        """
+        timestamps = self._get_timestamps(X)
+        n_samples = len(timestamps)
+        test_size = n_samples // (self.n_splits + 1)
+        if test_size == 0:
+            raise ValueError(f'Cannot split {n_samples} rows into {self.n_splits + 1} time blocks')
+
+        order = np.argsort(timestamps, kind='stable')
+        sorted_timestamps = timestamps[order]
+        embargo = np.timedelta64(int(self.embargo_hours * 3600), 's')
+
+        for test_start in range(n_samples - self.n_splits * test_size, n_samples, test_size):
+            train_end = np.searchsorted(sorted_timestamps,
+                                        sorted_timestamps[test_start] - embargo,
+                                        side='left')
+            if train_end > 0:
+                yield order[:train_end], order[test_start:test_start + test_size]
+
+    def _get_timestamps(self, X) -> np.ndarray:
+        if self.timestamps is not None:
+            timestamps = self.timestamps
+        elif isinstance(X, pd.DataFrame) and isinstance(X.index, pd.DatetimeIndex):
+            timestamps = X.index
+        else:
+            raise ValueError('EmbargoedTimeSeriesSplit needs timestamps or a DataFrame with a DatetimeIndex')
+
+        return to_utc_timestamps(timestamps)
+
+
+def to_utc_timestamps(timestamps: Union[np.ndarray, pd.Series, pd.Index]) -> np.ndarray:
+    """
+    Converts timestamps to naive UTC datetime64 values that can be compared and sorted. The
+    exported timestamps mix UTC offsets across DST changes, so they are only comparable in UTC.
+
+    Args:
+        timestamps (array-like): Timestamps as strings with UTC offsets or as datetimes.
+
+    Returns:
+        numpy.ndarray: The timestamps as datetime64 values in UTC.
+    """
+    timestamps = pd.to_datetime(pd.Series(np.asarray(timestamps)), utc=True)
+
+    return timestamps.dt.tz_localize(None).to_numpy()
@@ -1,24 +1,6 @@
+import os
 import pandas as pd
-
-#All the toc and tur files
-toc_files = [
-    'toc_pnwa_concentration_features.csv',
-    'toc_pnwa_load_features.csv',
-    'toc_wmth_concentration_features.csv',
-    'toc_wmth_load_features.csv'
-]
-
-tur_files = [
-    'tur_pnwa_concentration_features.csv',
-    'tur_pnwa_load_features.csv',
-    'tur_wmth_concentration_features.csv',
-    'tur_wmth_load_features.csv'
-]
-
-discharge_files = [
-    'discharge_pnwa_features.csv',
-    'discharge_wmth_features.csv'
-]
+from stations import get_param_feature_files, get_discharge_feature_files, get_lag_feature_files
 
 #Read and combine CSV files, grouping by 'timestamp_ccentral', df short for dataframe
 def read_and_merge_csv(files):
@@ -28,20 +10,35 @@ def read_and_merge_csv(files):
         merged_df = pd.merge(merged_df, df, on='timestamp_ccentral', how='outer')
     return merged_df
 
-#Combine all toc files
-toc_combined_df = read_and_merge_csv(toc_files)
-
-#Combine all tur files
-tur_combined_df = read_and_merge_csv(tur_files)
-
-#Combine all dischargefiles
-discharge_combined_df = read_and_merge_csv(discharge_files)
-
-#Combine the discharge data with toc and tur combined data
-toc_merged_df = pd.merge(toc_combined_df, discharge_combined_df, on="timestamp_ccentral", how="left")
-tur_merged_df = pd.merge(tur_combined_df, discharge_combined_df, on="timestamp_ccentral", how="left")
-
-#Save the combined csv files
-toc_merged_df.to_csv('toc_combined_with_discharge.csv', index=False)
-tur_merged_df.to_csv('tur_combined_with_discharge.csv', index=False)
-
+#Add the hourly upstream lag features (see lag_discovery.py) to every row of the hour it falls in
+def merge_lag_features(merged_df, files):
+    lag_df = read_and_merge_csv(files)
+    lag_df['hour'] = pd.to_datetime(lag_df.pop('timestamp_ccentral'), utc=True)
+    #The hour key is passed as an array, so no column is inserted into the (wide, fragmented) merged frame
+    hours = pd.to_datetime(merged_df['timestamp_ccentral'], utc=True).dt.floor('h').array
+    return pd.merge(merged_df, lag_df, left_on=hours, right_on='hour', how='left').drop(columns='hour')
+
+#Combine the feature files of a parameter for all the registered stations with the discharge files,
+#and with the upstream lag files of the parameter and discharge if lags is True
+def combine_param_with_discharge(param, output_file, input_dir='.', sites=None, lags=False):
+    param_files = [os.path.join(input_dir, file) for file in get_param_feature_files(param, sites)]
+    discharge_files = [os.path.join(input_dir, file) for file in get_discharge_feature_files(sites)]
+
+    #Combine the discharge data with the parameter's combined data
+    merged_df = pd.merge(read_and_merge_csv(param_files), read_and_merge_csv(discharge_files),
+                         on="timestamp_ccentral", how="left")
+
+    #Add the lag features of the station pairs, if any
+    lag_files = [os.path.join(input_dir, file) for file in
+                 get_lag_feature_files(param, sites) + get_lag_feature_files('discharge', sites)]
+    if lags and lag_files:
+        merged_df = merge_lag_features(merged_df, lag_files)
+
+    #Save the combined csv file
+    merged_df.to_csv(output_file, index=False)
+    return output_file
+
+if __name__ == '__main__':
+    #Combine all toc files and all tur files with the discharge files
+    combine_param_with_discharge('toc', 'toc_combined_with_discharge.csv')
+    combine_param_with_discharge('turbidity', 'tur_combined_with_discharge.csv')